@@ -3,8 +3,19 @@ from typing import Optional
 from fastapi import Depends, Header, Request, status
 
 from app.core.errors import http_error
-from app.state_v2 import get_mongo_store, get_redis_cache
+from app.core.token_cache import access_token_cache
+from app.state_v2 import (
+    get_blob_store,
+    get_mongo_store,
+    get_redis_cache,
+    get_revision_feed,
+    get_snapshot_service,
+)
+from app.database.blobs import BlobStore
 from app.database.mongo import MongoStore
+from app.database.redis import RedisCache
+from app.services.revision_feed import RevisionFeed
+from app.services.snapshot import SnapshotService
 
 
 async def get_mongo_store_dep() -> MongoStore:
@@ -15,6 +26,32 @@ async def get_redis_cache_dep():
     return await get_redis_cache()
 
 
+async def get_blob_store_dep() -> BlobStore:
+    return await get_blob_store()
+
+
+async def get_revision_feed_dep() -> RevisionFeed:
+    return await get_revision_feed()
+
+
+async def get_snapshot_service_dep() -> SnapshotService:
+    return await get_snapshot_service()
+
+
+async def get_token_owner(token: str, redis_cache: RedisCache) -> Optional[str]:
+    """The account an access token was issued to, or None if it is not valid."""
+    owner = access_token_cache.get(token)
+    if owner is not None:
+        return owner
+    owner = await redis_cache.get(f"access_token:{token}")
+    # Tokens issued before accounts were partitioned hold "1"; they are
+    # refused so the client refreshes into a token that names its account.
+    if not owner or owner == "1":
+        return None
+    access_token_cache.add(token, owner)
+    return owner
+
+
 async def require_auth(
     authorization: Optional[str] = Header(None, convert_underscores=False),
     redis_cache=Depends(get_redis_cache_dep),
@@ -27,13 +64,12 @@ async def require_auth(
         )
 
     token = authorization.replace("Bearer ", "", 1).strip()
-
-    is_valid = await redis_cache.get(f"access_token:{token}")
-    if is_valid != "1":
+    owner = await get_token_owner(token, redis_cache)
+    if owner is None:
         raise http_error(
             code="AUTH_TOKEN_INVALID",
             message="Access token is invalid or expired.",
             status_code=status.HTTP_401_UNAUTHORIZED,
         )
 
-    return token
+    return owner
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, Request, Response, status
-from fastapi.responses import StreamingResponse
+from typing import Optional
 
-from app.api.deps_v2 import require_auth, get_mongo_store_dep
+from fastapi import APIRouter, Depends, Header, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+
+from app.api.deps_v2 import require_auth, get_blob_store_dep, get_mongo_store_dep
+from app.core.errors import http_error
+from app.database.blobs import BlobStore
 from app.schemas.errors import ErrorResponse
 from app.services.attachments_v2 import AttachmentService
 from app.database.mongo import MongoStore
@@ -11,24 +15,77 @@ router = APIRouter(prefix="/attachments", tags=["attachments"])
 
 def get_attachment_service(
     store: MongoStore = Depends(get_mongo_store_dep),
+    blobs: BlobStore = Depends(get_blob_store_dep),
 ) -> AttachmentService:
-    return AttachmentService(store)
+    return AttachmentService(store, blobs)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _parse_range(range_header: str, size: int) -> Optional[tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive offsets.
+
+    Returns None for anything we do not serve as a partial response (other
+    units, multiple ranges, malformed values), in which case the full body is
+    sent as RFC 9110 allows. Unsatisfiable ranges raise 416.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            suffix = int(last)
+            if suffix <= 0:
+                raise ValueError
+            start = max(size - suffix, 0)
+            end = size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        raise http_error(
+            code="RANGE_NOT_SATISFIABLE",
+            message="Requested range is outside the attachment.",
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    if start > end:
+        return None
+    return start, min(end, size - 1)
 
 
 @router.put(
     "/{attachment_id}",
     status_code=status.HTTP_204_NO_CONTENT,
-    responses={401: {"model": ErrorResponse}},
+    responses={401: {"model": ErrorResponse}, 503: {"model": ErrorResponse}},
 )
 async def upload_attachment(
     attachment_id: str,
     request: Request,
-    token: str = Depends(require_auth),
+    content_sha256: Optional[str] = Header(None, alias="X-Content-SHA256"),
+    owner: str = Depends(require_auth),
     attachment_service: AttachmentService = Depends(get_attachment_service),
 ):
-    del token
-    body = await request.body()
-    await attachment_service.upload(attachment_id, body)
+    # With Expect: 100-continue the body is only sent once we start reading
+    # it, so a known digest lets the client skip the transfer entirely.
+    if content_sha256 and await attachment_service.link_existing(
+        owner, attachment_id, content_sha256
+    ):
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    await attachment_service.upload(owner, attachment_id, request.stream())
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -36,17 +93,54 @@ async def upload_attachment(
     "/{attachment_id}",
     responses={
         200: {"content": {"application/octet-stream": {}}},
+        206: {"content": {"application/octet-stream": {}}},
+        304: {"model": None},
         401: {"model": ErrorResponse},
         404: {"model": ErrorResponse},
+        416: {"model": ErrorResponse},
     },
 )
 async def download_attachment(
     attachment_id: str,
-    token: str = Depends(require_auth),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    owner: str = Depends(require_auth),
     attachment_service: AttachmentService = Depends(get_attachment_service),
 ):
-    del token
-    content = await attachment_service.download(attachment_id)
+    headers = {"Accept-Ranges": "bytes"}
+    etag = await attachment_service.get_etag(owner, attachment_id)
+    if etag:
+        headers["ETag"] = etag
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    body = await attachment_service.download(owner, attachment_id)
+
+    byte_range = None
+    if range_header and (not if_range or (etag and if_range.strip() == etag)):
+        byte_range = _parse_range(range_header, body.size)
+
+    if byte_range is None:
+        if body.path and not range_header:
+            # Whole-file downloads from the filesystem backend go through
+            # FileResponse so the server can use sendfile where it supports it.
+            return FileResponse(
+                body.path, media_type="application/octet-stream", headers=headers
+            )
+        headers["Content-Length"] = str(body.size)
+        return StreamingResponse(
+            content=body.iter_chunks(),
+            media_type="application/octet-stream",
+            headers=headers,
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{body.size}"
+    headers["Content-Length"] = str(end - start + 1)
     return StreamingResponse(
-        content=iter([content]), media_type="application/octet-stream"
+        content=body.iter_chunks(start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type="application/octet-stream",
+        headers=headers,
     )
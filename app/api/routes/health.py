@@ -1,5 +1,8 @@
 from fastapi import APIRouter
 
+from app.core.token_cache import access_token_cache
+from app.services.sync_v2 import changes_flights
+
 router = APIRouter(tags=["health"])
 
 
@@ -11,3 +14,12 @@ async def root():
 @router.get("/hello/{name}")
 async def say_hello(name: str):
     return {"message": f"Hello {name}"}
+
+
+@router.get("/stats")
+async def stats():
+    """Cache counters for the worker that serves the request."""
+    return {
+        "accessTokenCache": access_token_cache.stats(),
+        "changesFlights": changes_flights.stats(),
+    }
@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 
-from app.api.deps_v2 import get_mongo_store_dep
+from app.api.deps_v2 import (
+    get_mongo_store_dep,
+    get_redis_cache_dep,
+    get_revision_feed_dep,
+    require_auth,
+)
 from app.schemas.journal import (
     JournalListResponse,
     CreateJournalRequest,
@@ -8,14 +13,17 @@ from app.schemas.journal import (
     Journal,
 )
 from app.schemas.errors import ErrorResponse
-from app.services.journal_v2 import JournalService
+from app.services.journal_v2 import JournalListCache, JournalService
+from app.services.revision_feed import RevisionFeed
 from app.database.mongo import MongoStore
 
 
 def get_journal_service(
     store: MongoStore = Depends(get_mongo_store_dep),
+    revision_feed: RevisionFeed = Depends(get_revision_feed_dep),
+    redis_cache=Depends(get_redis_cache_dep),
 ) -> JournalService:
-    return JournalService(store)
+    return JournalService(store, revision_feed, JournalListCache(redis_cache))
 
 
 router = APIRouter(prefix="/journals", tags=["journals"])
@@ -26,9 +34,12 @@ router = APIRouter(prefix="/journals", tags=["journals"])
     response_model=JournalListResponse,
     responses={401: {"model": ErrorResponse}},
 )
-async def list_journals(journal_service: JournalService = Depends(get_journal_service)):
-    journals = await journal_service.list_journals()
-    return JournalListResponse(journals=journals)
+async def list_journals(
+    owner: str = Depends(require_auth),
+    journal_service: JournalService = Depends(get_journal_service),
+):
+    body = await journal_service.list_journals_body(owner)
+    return Response(content=body, media_type="application/json")
 
 
 @router.post(
@@ -38,9 +49,10 @@ async def list_journals(journal_service: JournalService = Depends(get_journal_se
 )
 async def create_journal(
     payload: CreateJournalRequest,
+    owner: str = Depends(require_auth),
     journal_service: JournalService = Depends(get_journal_service),
 ):
-    return await journal_service.create_journal(payload)
+    return await journal_service.create_journal(owner, payload)
 
 
 @router.put(
@@ -55,9 +67,10 @@ async def create_journal(
 async def update_journal(
     journal_id: str,
     payload: UpdateJournalRequest,
+    owner: str = Depends(require_auth),
     journal_service: JournalService = Depends(get_journal_service),
 ):
-    return await journal_service.update_journal(journal_id, payload)
+    return await journal_service.update_journal(owner, journal_id, payload)
 
 
 @router.delete(
@@ -71,6 +84,7 @@ async def update_journal(
 )
 async def delete_journal(
     journal_id: str,
+    owner: str = Depends(require_auth),
     journal_service: JournalService = Depends(get_journal_service),
 ):
-    await journal_service.delete_journal(journal_id)
+    await journal_service.delete_journal(owner, journal_id)
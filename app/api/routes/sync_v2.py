@@ -1,43 +1,331 @@
-from fastapi import APIRouter, Depends
+import asyncio
+import hashlib
+import os
+from typing import AsyncIterator, Optional
 
-from app.api.deps_v2 import require_auth, get_mongo_store_dep
+import msgpack
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketException,
+    status,
+)
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import ValidationError
+
+from app.api.deps_v2 import (
+    get_blob_store_dep,
+    get_mongo_store_dep,
+    get_redis_cache_dep,
+    get_revision_feed_dep,
+    get_snapshot_service_dep,
+    get_token_owner,
+    require_auth,
+)
+from app.core.compression import (
+    DecompressingRoute,
+    choose_encoding,
+    compress_stream,
+    compressed_response,
+)
+from app.core.errors import http_error
+from app.core.sync_encoding import (
+    MSGPACK_MEDIA_TYPE,
+    SyncJSONResponse,
+    dumps,
+    packb,
+    unpackb,
+)
 from app.schemas.errors import ErrorResponse
 from app.schemas.sync import PushRequest, PushResponse, SyncChangesResponse
-from app.services.sync_v2 import SyncService
+from app.api.routes.attachments_v2 import get_attachment_service
+from app.database.blobs import BlobStore
+from app.services.attachments_v2 import AttachmentService
+from app.services.journal_v2 import JournalListCache
+from app.services.revision_feed import RevisionFeed
+from app.services.snapshot import SnapshotService, read_lines
+from app.services.sync_v2 import PushReplayCache, SyncService
 from app.database.mongo import MongoStore
 
-router = APIRouter(prefix="/sync", tags=["sync"])
+router = APIRouter(prefix="/sync", tags=["sync"], route_class=DecompressingRoute)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
+# Longest Idempotency-Key accepted on /sync/push.
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Seconds between keep-alives on an idle stream; keep it below proxy read timeouts.
+SYNC_STREAM_HEARTBEAT = float(os.getenv("SYNC_STREAM_HEARTBEAT", "25"))
+
+PUSH_REQUEST_SCHEMA = PushRequest.model_json_schema(
+    ref_template="#/components/schemas/{model}"
+)
+PUSH_REQUEST_SCHEMA.pop("$defs", None)
+
+
+def _is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip() == MSGPACK_MEDIA_TYPE
 
 
 def get_sync_service(
     store: MongoStore = Depends(get_mongo_store_dep),
+    attachment_service: AttachmentService = Depends(get_attachment_service),
+    revision_feed: RevisionFeed = Depends(get_revision_feed_dep),
+    redis_cache=Depends(get_redis_cache_dep),
 ) -> SyncService:
-    return SyncService(store)
+    return SyncService(
+        store, attachment_service, revision_feed, JournalListCache(redis_cache)
+    )
 
 
 @router.get(
     "/changes",
     response_model=SyncChangesResponse,
-    responses={401: {"model": ErrorResponse}},
+    responses={
+        200: {"content": {NDJSON_MEDIA_TYPE: {}, MSGPACK_MEDIA_TYPE: {}}},
+        401: {"model": ErrorResponse},
+        410: {"model": ErrorResponse},
+    },
 )
 async def get_changes(
     since: int = 0,
-    token: str = Depends(require_auth),
+    limit: Optional[int] = Query(None, ge=1),
+    accept: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    owner: str = Depends(require_auth),
     sync_service: SyncService = Depends(get_sync_service),
 ):
-    del token
-    return await sync_service.get_changes(since=since)
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        body = await sync_service.stream_changes(owner, since=since)
+        headers = {"Vary": "Accept-Encoding"}
+        encoding = choose_encoding(accept_encoding)
+        if encoding:
+            body = compress_stream(body, encoding)
+            headers["Content-Encoding"] = encoding
+        return StreamingResponse(body, media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    media_type = (
+        MSGPACK_MEDIA_TYPE if accept and MSGPACK_MEDIA_TYPE in accept else "application/json"
+    )
+    body = await sync_service.get_changes_body(
+        owner, since=since, limit=limit, media_type=media_type
+    )
+    return await compressed_response(body, accept_encoding, media_type=media_type)
+
+
+@router.get(
+    "/snapshot",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {NDJSON_MEDIA_TYPE: {}}},
+        401: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+    },
+)
+async def get_snapshot(
+    accept_encoding: Optional[str] = Header(None),
+    owner: str = Depends(require_auth),
+    snapshot_service: SnapshotService = Depends(get_snapshot_service_dep),
+    blob_store: BlobStore = Depends(get_blob_store_dep),
+):
+    """Every live document as of one revision, for bootstrapping a new device.
+
+    Same lines as the NDJSON form of `/sync/changes`, without tombstones,
+    ending with an "end" line whose `latestRevision` is the revision to pass
+    as `since` afterwards. The image is pre-built and stored gzip-compressed,
+    so it is sent as stored to clients that accept gzip.
+    """
+    snapshot = await snapshot_service.current(owner)
+    body = await blob_store.open(snapshot["sha256"]) if snapshot else None
+    if body is None:
+        raise http_error(
+            code="SNAPSHOT_NOT_FOUND",
+            message="No snapshot is available; sync from since=0 instead.",
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+
+    headers = {
+        "ETag": f'"{snapshot["sha256"]}"',
+        "X-Snapshot-Revision": str(snapshot["revision"]),
+        "Vary": "Accept-Encoding",
+    }
+    if choose_encoding(accept_encoding, ("gzip",)) is None:
+        return StreamingResponse(
+            read_lines(body), media_type=NDJSON_MEDIA_TYPE, headers=headers
+        )
+
+    headers["Content-Encoding"] = "gzip"
+    if body.path:
+        return FileResponse(body.path, media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    headers["Content-Length"] = str(body.size)
+    return StreamingResponse(
+        body.iter_chunks(), media_type=NDJSON_MEDIA_TYPE, headers=headers
+    )
 
 
 @router.post(
     "/push",
     response_model=PushResponse,
-    responses={401: {"model": ErrorResponse}},
+    responses={
+        200: {"content": {MSGPACK_MEDIA_TYPE: {}}},
+        400: {"model": ErrorResponse},
+        401: {"model": ErrorResponse},
+        409: {"model": ErrorResponse},
+        422: {"model": ErrorResponse},
+    },
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": PUSH_REQUEST_SCHEMA},
+                MSGPACK_MEDIA_TYPE: {"schema": PUSH_REQUEST_SCHEMA},
+            },
+        }
+    },
 )
 async def push_changes(
-    payload: PushRequest,
-    token: str = Depends(require_auth),
+    request: Request,
+    response: Response,
+    content_type: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+    owner: str = Depends(require_auth),
     sync_service: SyncService = Depends(get_sync_service),
+    redis_cache=Depends(get_redis_cache_dep),
 ):
-    del token
-    return await sync_service.push_changes(payload)
+    """Push local changes.
+
+    Send an `Idempotency-Key` (any unique string per logical push) to make
+    retries safe: a repeat returns the first response, marked with
+    `Idempotent-Replayed: true`, without writing anything again.
+    """
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise http_error(
+            code="IDEMPOTENCY_KEY_INVALID",
+            message=f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters.",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    body = await request.body()
+    try:
+        if _is_msgpack(content_type):
+            try:
+                data = unpackb(body)
+            except (ValueError, TypeError, msgpack.UnpackException):
+                raise http_error(
+                    code="INVALID_MSGPACK",
+                    message="Request body is not valid msgpack.",
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                )
+            payload = PushRequest.model_validate(data)
+        else:
+            payload = PushRequest.model_validate_json(body)
+    except ValidationError as exc:
+        errors = [
+            {**error, "loc": ("body", *error["loc"])}
+            for error in exc.errors(include_url=False)
+        ]
+        raise RequestValidationError(errors, body=body)
+
+    if idempotency_key is None:
+        result = await sync_service.push_changes(owner, payload)
+    else:
+        result, replayed = await PushReplayCache(redis_cache).run(
+            owner,
+            idempotency_key,
+            hashlib.sha256(body).hexdigest(),
+            lambda: sync_service.push_changes(owner, payload),
+        )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+
+    if accept and MSGPACK_MEDIA_TYPE in accept:
+        return Response(
+            content=packb(result.dict()),
+            media_type=MSGPACK_MEDIA_TYPE,
+            headers=dict(response.headers),
+        )
+    return SyncJSONResponse(result.dict(), headers=dict(response.headers))
+
+
+async def _revision_events(
+    revision_feed: RevisionFeed, owner: str, since: int
+) -> AsyncIterator[bytes]:
+    async for revision in revision_feed.watch(owner, since, SYNC_STREAM_HEARTBEAT):
+        if revision is None:
+            yield b": ping\n\n"
+        else:
+            data = dumps({"latestRevision": revision})
+            yield b"id: %d\nevent: revision\ndata: %s\n\n" % (revision, data)
+
+
+@router.get(
+    "/stream",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {EVENT_STREAM_MEDIA_TYPE: {}}},
+        401: {"model": ErrorResponse},
+    },
+)
+async def stream_revisions(
+    since: Optional[int] = None,
+    last_event_id: Optional[int] = Header(None),
+    owner: str = Depends(require_auth),
+    revision_feed: RevisionFeed = Depends(get_revision_feed_dep),
+):
+    """Server-sent "revision" events whenever newer changes are committed.
+
+    Each event carries the latest committed revision; fetch the changes with
+    `/sync/changes`. Reconnecting clients resume from `Last-Event-ID`.
+    """
+    if since is None:
+        since = last_event_id or 0
+    return StreamingResponse(
+        _revision_events(revision_feed, owner, since),
+        media_type=EVENT_STREAM_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/stream")
+async def stream_revisions_ws(
+    websocket: WebSocket,
+    since: int = 0,
+    token: Optional[str] = None,
+    authorization: Optional[str] = Header(None, convert_underscores=False),
+    redis_cache=Depends(get_redis_cache_dep),
+    revision_feed: RevisionFeed = Depends(get_revision_feed_dep),
+):
+    """WebSocket variant of `/sync/stream` for clients that cannot use SSE.
+
+    Browsers cannot set headers on a WebSocket, so the access token may also
+    be passed as the `token` query parameter.
+    """
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.replace("Bearer ", "", 1).strip()
+    owner = await get_token_owner(token, redis_cache) if token else None
+    if owner is None:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+
+    await websocket.accept()
+
+    async def send_revisions():
+        # Keep-alive on WebSockets is left to the server's protocol pings.
+        async for revision in revision_feed.watch(owner, since, SYNC_STREAM_HEARTBEAT):
+            if revision is not None:
+                await websocket.send_text(
+                    dumps({"type": "revision", "latestRevision": revision}).decode()
+                )
+
+    sender = asyncio.create_task(send_revisions())
+    try:
+        # Nothing is expected from the client; reading only notices it leaving.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
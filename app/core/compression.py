@@ -0,0 +1,177 @@
+import gzip
+import io
+import os
+import zlib
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+from fastapi import Request, Response, status
+from fastapi.routing import APIRoute
+import anyio
+
+from app.core.errors import http_error
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+MAX_DECOMPRESSED_SIZE = int(os.getenv("MAX_DECOMPRESSED_SIZE", str(50 * 1024 * 1024)))
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+STREAM_BATCH_SIZE = 64 * 1024
+
+
+def supported_encodings() -> list[str]:
+    """Encodings we can produce, most preferred first."""
+    return ["zstd", "gzip"] if zstandard else ["gzip"]
+
+
+def choose_encoding(
+    accept_encoding: Optional[str], encodings: Optional[Iterable[str]] = None
+) -> Optional[str]:
+    if not accept_encoding:
+        return None
+
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        weights[coding.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for coding in encodings if encodings is not None else supported_encodings():
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _decompress(data: bytes, encoding: str) -> bytes:
+    limit = MAX_DECOMPRESSED_SIZE
+    try:
+        if encoding == "zstd" and zstandard:
+            # Concatenated frames decode to the concatenated content.
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                io.BytesIO(data), read_across_frames=True
+            )
+            result = reader.read(limit + 1)
+            too_large = len(result) > limit
+        elif encoding in ("gzip", "x-gzip"):
+            result, too_large = _gunzip(data, limit)
+        else:
+            raise http_error(
+                code="UNSUPPORTED_CONTENT_ENCODING",
+                message=f"Content-Encoding {encoding!r} is not supported.",
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+    except (zlib.error, getattr(zstandard, "ZstdError", zlib.error)):
+        raise http_error(
+            code="INVALID_CONTENT_ENCODING",
+            message="Request body could not be decompressed.",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if too_large:
+        raise http_error(
+            code="PAYLOAD_TOO_LARGE",
+            message="Decompressed request body is too large.",
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    return result
+
+
+def _gunzip(data: bytes, limit: int) -> tuple[bytes, bool]:
+    """Decode every member of a gzip body, as ``gzip.decompress`` does."""
+    parts = []
+    size = 0
+    while data:
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        part = decompressor.decompress(data, limit + 1 - size)
+        parts.append(part)
+        size += len(part)
+        if size > limit or decompressor.unconsumed_tail:
+            return b"", True
+        if not decompressor.eof:
+            raise zlib.error("truncated gzip member")
+        data = decompressor.unused_data
+    return b"".join(parts), False
+
+
+async def compressed_response(
+    body: bytes,
+    accept_encoding: Optional[str],
+    media_type: str = "application/json",
+) -> Response:
+    """Build a response for ``body``, compressing it when the client allows and
+    it is large enough to be worth it. Compression runs in the thread pool."""
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = choose_encoding(accept_encoding)
+    if encoding and len(body) >= COMPRESSION_MIN_SIZE:
+        body = await anyio.to_thread.run_sync(_compress, body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+async def compress_stream(
+    chunks: AsyncIterator[bytes], encoding: str
+) -> AsyncIterator[bytes]:
+    """Compress ``chunks`` as one stream. Like ``compressed_response`` the
+    compression runs in the thread pool, a ``STREAM_BATCH_SIZE`` batch at a
+    time so small chunks do not each pay for a thread hop."""
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    batch = bytearray()
+    async for chunk in chunks:
+        batch += chunk
+        if len(batch) >= STREAM_BATCH_SIZE:
+            data = await anyio.to_thread.run_sync(compressor.compress, bytes(batch))
+            batch.clear()
+            if data:
+                yield data
+    data = await anyio.to_thread.run_sync(_finish, compressor, bytes(batch))
+    if data:
+        yield data
+
+
+def _finish(compressor, data: bytes) -> bytes:
+    return compressor.compress(data) + compressor.flush()
+
+
+class DecompressingRequest(Request):
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            encoding = self.headers.get("content-encoding", "identity").strip().lower()
+            if body and encoding != "identity":
+                body = await anyio.to_thread.run_sync(_decompress, body, encoding)
+            self._body = body
+        return self._body
+
+
+class DecompressingRoute(APIRoute):
+    """Route that transparently accepts gzip or zstd encoded request bodies."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def decompressing_handler(request: Request) -> Response:
+            return await handler(DecompressingRequest(request.scope, request.receive))
+
+        return decompressing_handler
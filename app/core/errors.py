@@ -1,10 +1,15 @@
+from typing import Optional
+
 from fastapi import HTTPException, status
 
 from app.schemas.errors import ErrorDetail, ErrorResponse
 
 
-def http_error(code: str, message: str, status_code: int) -> HTTPException:
+def http_error(
+    code: str, message: str, status_code: int, headers: Optional[dict] = None
+) -> HTTPException:
     return HTTPException(
         status_code=status_code,
         detail=ErrorResponse(error=ErrorDetail(code=code, message=message)).dict(),
+        headers=headers,
     )
@@ -0,0 +1,40 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Per-worker coalescing of identical concurrent calls.
+
+    The first caller for a key runs the call; callers arriving with the same
+    key while it is still running await the same result (or exception)
+    instead of running their own. Nothing is kept once the call finishes.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            flight = asyncio.ensure_future(call())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+        # A caller that goes away must not cancel the call for the others.
+        return await asyncio.shield(flight)
+
+    def _land(self, key: Hashable, flight: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled():
+            # Mark the exception retrieved even if every caller went away.
+            flight.exception()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,115 @@
+import binascii
+from datetime import datetime, timezone
+from typing import Any, Union
+
+import msgpack
+import orjson
+from fastapi.responses import Response
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Matches how pydantic renders the sync schemas: naive datetimes as plain
+# ISO 8601, UTC as "Z", microseconds only when present.
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+def _json_default(value: Any) -> Any:
+    # Binary entry payloads are base64 text in the JSON protocol.
+    if isinstance(value, bytes):
+        return binascii.b2a_base64(value, newline=False).decode("ascii")
+    raise TypeError(f"Cannot serialize {type(value).__name__} to JSON")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_json_default, option=ORJSON_OPTIONS)
+
+
+def payload_to_storage(payload: Union[str, bytes]) -> Union[bytes, str]:
+    """Turn an API payload (base64 text or raw bytes) into what entries store.
+
+    Text that is not valid base64 cannot be converted losslessly and is kept
+    as a string.
+    """
+    if isinstance(payload, bytes):
+        return payload
+    try:
+        return binascii.a2b_base64(payload, strict_mode=True)
+    except (binascii.Error, ValueError):
+        return payload
+
+
+def entry_change(doc: dict) -> dict:
+    return {
+        "id": doc["id"],
+        "journalId": doc["journal_id"],
+        "payloadEncrypted": doc["payload_encrypted"],
+        "payloadVersion": doc["payload_version"],
+        "attachmentIds": doc["attachment_ids"],
+        "createdAt": doc["created_at"],
+        "updatedAt": doc["updated_at"],
+        "deletedAt": doc.get("deleted_at"),
+        "revision": doc.get("revision"),
+    }
+
+
+def attachment_change(doc: dict) -> dict:
+    return {
+        "id": doc["id"],
+        "sha256": doc["sha256"],
+        "sizeBytes": doc["size_bytes"],
+        "mimeType": doc["mime_type"],
+        "createdAt": doc["created_at"],
+        "updatedAt": doc["updated_at"],
+        "deletedAt": doc.get("deleted_at"),
+        "revision": doc.get("revision"),
+    }
+
+
+def journal_change(doc: dict) -> dict:
+    return {
+        "id": doc["id"],
+        "name": doc["name"],
+        "color": doc.get("color"),
+        "createdAt": doc["created_at"],
+        "updatedAt": doc["updated_at"],
+        "deletedAt": doc.get("deleted_at"),
+        "revision": doc.get("revision"),
+    }
+
+
+class SyncJSONResponse(Response):
+    """JSON response for sync payloads built from plain dicts, encoded with orjson.
+
+    The output is byte-for-byte what FastAPI produces for the equivalent
+    pydantic response models.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        # Stored datetimes are naive UTC; skip the tz round trip for them.
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        delta = value - _EPOCH
+        return msgpack.Timestamp(
+            delta.days * 86400 + delta.seconds, delta.microseconds * 1000
+        )
+    raise TypeError(f"Cannot serialize {type(value).__name__} to msgpack")
+
+
+def packb(content: Any) -> bytes:
+    return msgpack.packb(content, default=_msgpack_default)
+
+
+def unpackb(body: bytes) -> Any:
+    """Decode a msgpack document; timestamps come back as aware UTC datetimes."""
+    return msgpack.unpackb(body, timestamp=3)
+
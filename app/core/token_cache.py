@@ -0,0 +1,57 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+ACCESS_TOKEN_CACHE_SIZE = int(os.getenv("ACCESS_TOKEN_CACHE_SIZE", "10000"))
+ACCESS_TOKEN_CACHE_TTL = float(os.getenv("ACCESS_TOKEN_CACHE_TTL", "5.0"))
+
+
+class AccessTokenCache:
+    """Per-worker LRU of access tokens that Redis recently confirmed as valid,
+    with the account each one belongs to.
+
+    A cached token is trusted for ``ttl`` seconds without asking Redis, so a
+    token revoked on another worker can keep working here for at most that
+    long. Only valid tokens are cached.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[str]:
+        """The owner of a cached token, or None when Redis must be asked."""
+        entry = self._entries.get(token)
+        if entry is not None and entry[1] > time.monotonic():
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+        if entry is not None:
+            del self._entries[token]
+        self.misses += 1
+        return None
+
+    def add(self, token: str, owner: str) -> None:
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        self._entries[token] = (owner, time.monotonic() + self.ttl)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, token: Optional[str] = None) -> None:
+        """Forget one token, or every token when none is given."""
+        if token is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(token, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+access_token_cache = AccessTokenCache(ACCESS_TOKEN_CACHE_SIZE, ACCESS_TOKEN_CACHE_TTL)
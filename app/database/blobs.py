@@ -0,0 +1,268 @@
+import hashlib
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional, Union
+
+import anyio
+from bson import ObjectId
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
+from pymongo.errors import DuplicateKeyError
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class BlobBody(ABC):
+    """A stored blob opened for reading.
+
+    ``path`` is set when the blob is a plain file that can be handed to the
+    server as-is instead of being streamed through Python.
+    """
+
+    path: Optional[str] = None
+
+    def __init__(self, size: int):
+        self.size = size
+
+    @abstractmethod
+    def iter_chunks(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Yield bytes ``start`` through ``end`` (inclusive) of the body."""
+
+
+class BytesBody(BlobBody):
+    def __init__(self, content: bytes):
+        super().__init__(len(content))
+        self.content = content
+
+    async def iter_chunks(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        end = self.size - 1 if end is None else end
+        yield self.content[start : end + 1]
+
+
+class GridFSBody(BlobBody):
+    def __init__(self, grid_out):
+        super().__init__(grid_out.length)
+        self.grid_out = grid_out
+
+    async def iter_chunks(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        end = self.size - 1 if end is None else end
+        self.grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await self.grid_out.readchunk()
+            if not chunk:
+                break
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+
+
+class FileBody(BlobBody):
+    def __init__(self, path: str, size: int):
+        super().__init__(size)
+        self.path = path
+
+    async def iter_chunks(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        end = self.size - 1 if end is None else end
+        if self.size == 0:
+            return
+        # Ranged reads seek straight to the requested bytes; every disk access
+        # runs in the thread pool, off the event loop.
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await f.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+class StagedBlob(ABC):
+    """Content written to a store but not yet visible under its digest.
+
+    ``commit`` makes it readable as ``sha256``, keeping an identical copy
+    that is already stored instead; ``discard`` drops it.
+    """
+
+    def __init__(self, sha256: str, size: int):
+        self.sha256 = sha256
+        self.size = size
+
+    @abstractmethod
+    async def commit(self) -> None:
+        ...
+
+    @abstractmethod
+    async def discard(self) -> None:
+        ...
+
+
+class StagedGridFSBlob(StagedBlob):
+    def __init__(self, store: "GridFSBlobStore", file_id: ObjectId, sha256: str, size: int):
+        super().__init__(sha256, size)
+        self.store = store
+        self.file_id = file_id
+
+    async def commit(self) -> None:
+        await self.store._claim(self.file_id, self.sha256)
+
+    async def discard(self) -> None:
+        await self.store.fs.delete(self.file_id)
+
+
+class StagedFile(StagedBlob):
+    def __init__(self, store: "FileSystemBlobStore", tmp_path: str, sha256: str, size: int):
+        super().__init__(sha256, size)
+        self.store = store
+        self.tmp_path = tmp_path
+
+    async def commit(self) -> None:
+        try:
+            await anyio.to_thread.run_sync(
+                self.store._commit, self.tmp_path, self.store._path(self.sha256)
+            )
+        except BaseException:
+            await self.discard()
+            raise
+
+    async def discard(self) -> None:
+        await anyio.to_thread.run_sync(_remove_quietly, self.tmp_path)
+
+
+class GridFSBlobStore:
+    """Content-addressed blobs kept in the ``attachments`` GridFS bucket."""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.fs = AsyncIOMotorGridFSBucket(db, bucket_name="attachments")
+
+    async def write(self, chunks: AsyncIterator[bytes]) -> tuple[str, int]:
+        blob = await self.stage(chunks)
+        await blob.commit()
+        return blob.sha256, blob.size
+
+    async def stage(self, chunks: AsyncIterator[bytes]) -> StagedBlob:
+        digest = hashlib.sha256()
+        file_id = ObjectId()
+        grid_in = self.fs.open_upload_stream_with_id(file_id, f"pending:{uuid.uuid4()}")
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                await grid_in.write(chunk)
+        except BaseException:
+            await grid_in.abort()
+            raise
+        await grid_in.close()
+        return StagedGridFSBlob(self, file_id, digest.hexdigest(), grid_in.length)
+
+    async def _claim(self, file_id: ObjectId, sha256: str) -> None:
+        files = self.db["attachments.files"]
+        # Files written before the metadata.sha256 tag are matched by name.
+        if await files.find_one({"filename": sha256}, {"_id": 1}):
+            await self.fs.delete(file_id)
+            return
+        try:
+            # The unique metadata.sha256 index lets exactly one concurrent
+            # upload of the same content claim the name.
+            await files.update_one(
+                {"_id": file_id},
+                {"$set": {"filename": sha256, "metadata.sha256": sha256}},
+            )
+        except DuplicateKeyError:
+            await self.fs.delete(file_id)
+
+    async def open(self, sha256: str) -> Optional[BlobBody]:
+        try:
+            grid_out = await self.fs.open_download_stream_by_name(sha256)
+        except NoFile:
+            return None
+        return GridFSBody(grid_out)
+
+    async def delete(self, sha256: str) -> None:
+        async for doc in self.db["attachments.files"].find({"filename": sha256}, {"_id": 1}):
+            await self.fs.delete(doc["_id"])
+
+
+class FileSystemBlobStore:
+    """Content-addressed blobs in a sharded directory tree (``ab/cd/abcd...``)."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    async def write(self, chunks: AsyncIterator[bytes]) -> tuple[str, int]:
+        blob = await self.stage(chunks)
+        await blob.commit()
+        return blob.sha256, blob.size
+
+    async def stage(self, chunks: AsyncIterator[bytes]) -> StagedBlob:
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.tmp_dir, str(uuid.uuid4()))
+        try:
+            async with await anyio.open_file(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            await anyio.to_thread.run_sync(_remove_quietly, tmp_path)
+            raise
+        return StagedFile(self, tmp_path, digest.hexdigest(), size)
+
+    @staticmethod
+    def _commit(tmp_path: str, path: str) -> None:
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    async def open(self, sha256: str) -> Optional[BlobBody]:
+        path = self._path(sha256)
+        try:
+            stat = await anyio.to_thread.run_sync(os.stat, path)
+        except FileNotFoundError:
+            return None
+        return FileBody(path, stat.st_size)
+
+    async def delete(self, sha256: str) -> None:
+        await anyio.to_thread.run_sync(_remove_quietly, self._path(sha256))
+
+
+BlobStore = Union[GridFSBlobStore, FileSystemBlobStore]
+
+ATTACHMENT_STORAGES = ("mongo", "filesystem")
+
+
+def make_blob_store(storage: str, path: str, db: AsyncIOMotorDatabase) -> BlobStore:
+    """Build the ``ATTACHMENT_STORAGE`` backend; unknown names are an error."""
+    if storage == "mongo":
+        return GridFSBlobStore(db)
+    if storage == "filesystem":
+        return FileSystemBlobStore(path)
+    raise ValueError(
+        f"Unknown attachment storage {storage!r}; expected one of {', '.join(ATTACHMENT_STORAGES)}"
+    )
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
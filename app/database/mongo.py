@@ -1,6 +1,19 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Optional
-from datetime import datetime
+import asyncio
+import logging
+import time
+from gridfs.errors import NoFile
+from pymongo.errors import BulkWriteError
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+    AsyncIOMotorCollection,
+    AsyncIOMotorCursor,
+    AsyncIOMotorGridFSBucket,
+    AsyncIOMotorGridOut,
+)
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from typing import Awaitable, Callable, Optional
+from datetime import datetime, timedelta
+from app.core.hlc import HybridLogicalClock
 from app.models.mongo import (
     MongoEntry,
     MongoAttachmentMeta,
@@ -11,60 +24,549 @@ from app.models.mongo import (
 )
 
 
+# Fields the sync endpoints read from each collection.
+ENTRY_CHANGE_FIELDS = {
+    "_id": 0,
+    "id": 1,
+    "journal_id": 1,
+    "payload_encrypted": 1,
+    "payload_version": 1,
+    "attachment_ids": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "deleted_at": 1,
+    "revision": 1,
+}
+ATTACHMENT_META_CHANGE_FIELDS = {
+    "_id": 0,
+    "id": 1,
+    "sha256": 1,
+    "size_bytes": 1,
+    "mime_type": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "deleted_at": 1,
+    "revision": 1,
+}
+JOURNAL_CHANGE_FIELDS = {
+    "_id": 0,
+    "id": 1,
+    "name": 1,
+    "color": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "deleted_at": 1,
+    "revision": 1,
+}
+
+
+def _revision_range(owner: str, since: int, until: Optional[int]) -> dict:
+    revision = {"$gt": since}
+    if until is not None:
+        revision["$lte"] = until
+    return {"owner": owner, "revision": revision}
+
+
+# Server error code for a unique index violation.
+DUPLICATE_KEY_ERROR = 11000
+
+REVISION_SOURCES = ("sequence", "hlc")
+
+# Shortest REVISION_LEASE_TTL accepted; leases are only safe when writes land
+# well within it.
+MIN_REVISION_LEASE_TTL = 1.0
+# Rounds of re-stamping for writes that keep landing after their lease.
+LATE_WRITE_ATTEMPTS = 3
+# Reservations kept per account for re-stamping late writes (see
+# _RevisionLease.deadlines); plain blocks drop theirs once settled.
+MAX_TRACKED_RANGES = 1024
+
+# Seconds after which a blob still marked as being deleted is taken to have
+# been abandoned mid-delete, and an upload of the same content may reuse it.
+ABANDONED_BLOB_DELETE_SECONDS = 300
+
+logger = logging.getLogger(__name__)
+
+
+def _sequence(owner: str) -> dict:
+    """Filter for the revision counter of one account."""
+    return {"name": f"revision:{owner}"}
+
+
+def _open_horizon(sequence: Optional[dict]) -> int:
+    """Highest revision below every open block or lease of a sequence document."""
+    if not sequence:
+        return 0
+    now = datetime.utcnow()
+    open_starts = [
+        lease["start"] for lease in sequence.get("leases", []) if lease["expires_at"] > now
+    ]
+    return min(open_starts) - 1 if open_starts else sequence.get("value", 0)
+
+
+class _RevisionLease:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.next = 1
+        self.end = 0
+        self.issue_until = 0.0
+        # (start, end, deadline, expires) of recent leases, or of unsettled
+        # blocks when not leasing, oldest first, in
+        # time.monotonic() terms: a write with a revision in [start, end]
+        # must be acknowledged before the deadline, and readers wait for the
+        # lease until it expires.
+        self.deadlines: list[tuple[int, int, float, float]] = []
+
+
 class MongoStore:
-    def __init__(self, mongodb_url: str, db_name: str):
+    def __init__(
+        self,
+        mongodb_url: str,
+        db_name: str,
+        revision_lease_size: int = 0,
+        revision_lease_ttl: float = 2.0,
+        revision_source: str = "sequence",
+        hlc_node_id: Optional[int] = None,
+        hlc_read_delay: float = 1.0,
+        revision_block_ttl: float = 30.0,
+    ):
+        if revision_source not in REVISION_SOURCES:
+            raise ValueError(
+                f"Unknown REVISION_SOURCE {revision_source!r}; expected one of {', '.join(REVISION_SOURCES)}"
+            )
+        if revision_source == "hlc" and hlc_node_id is None:
+            raise ValueError("REVISION_SOURCE=hlc needs a unique HLC_NODE_ID for every process")
+        if revision_lease_size and revision_lease_ttl < MIN_REVISION_LEASE_TTL:
+            raise ValueError(
+                f"REVISION_LEASE_TTL must be at least {MIN_REVISION_LEASE_TTL} seconds"
+            )
         self.client = AsyncIOMotorClient(mongodb_url)
         self.db = self.client[db_name]
+        self.attachments_fs = AsyncIOMotorGridFSBucket(self.db, bucket_name="attachments")
+        self.revision_lease_size = revision_lease_size
+        self.revision_lease_ttl = revision_lease_ttl
+        # Without leasing or HLC every reservation is an open block that
+        # readers wait for until it is settled, or for this long at most.
+        self.revision_block_ttl = revision_block_ttl
+        self._leases: dict[str, _RevisionLease] = {}
+        # With "hlc" revisions come from a local clock instead of the
+        # per-owner sequence documents.
+        self.clock = HybridLogicalClock(hlc_node_id) if revision_source == "hlc" else None
+        self.hlc_read_delay = hlc_read_delay
+        self.revision_listeners: list[Callable[[str, list[int]], Awaitable[None]]] = []
 
     async def init_indexes(self):
-        await self.db.journals.create_index("id", unique=True)
-        await self.db.journals.create_index("revision")
-        await self.db.entries.create_index("id", unique=True)
+        # Every synced document belongs to one account; ids are only unique
+        # within it, and change feeds are per-account revision ranges.
+        for collection in (self.db.journals, self.db.entries, self.db.attachments_meta):
+            await collection.create_index([("owner", 1), ("id", 1)], unique=True)
+            await collection.create_index([("owner", 1), ("revision", 1)])
+        await self.db.journals.create_index("deleted_at")
         await self.db.entries.create_index("journal_id")
-        await self.db.entries.create_index("revision")
-        await self.db.attachments_meta.create_index("id", unique=True)
-        await self.db.attachments_meta.create_index("revision")
-        await self.db.attachments_content.create_index("id", unique=True)
+        await self.db.entries.create_index(
+            "deleted_at", partialFilterExpression={"deleted_at": {"$type": "date"}}
+        )
+        await self.db.attachments_meta.create_index(
+            "deleted_at", partialFilterExpression={"deleted_at": {"$type": "date"}}
+        )
+        for collection in (self.db.journals, self.db.entries, self.db.attachments_meta):
+            await collection.create_index(
+                "deleted_seen_at",
+                partialFilterExpression={"deleted_seen_at": {"$type": "date"}},
+            )
+        # Attachment content is per account too, like the metadata.
+        await self.db.attachments_content.create_index([("owner", 1), ("id", 1)], unique=True)
+        await self.db.attachment_refs.create_index([("owner", 1), ("id", 1)], unique=True)
+        await self.db.attachment_refs.create_index([("owner", 1), ("sha256", 1)])
+        await self.db["attachments.files"].create_index([("filename", 1), ("metadata.owner", 1)])
+        # Content-addressed GridFS blobs (see GridFSBlobStore.write).
+        await self.db["attachments.files"].create_index(
+            "metadata.sha256",
+            unique=True,
+            partialFilterExpression={"metadata.sha256": {"$type": "string"}},
+        )
+        await self.db.attachment_blobs.create_index("sha256", unique=True)
         await self.db.refresh_tokens.create_index("token", unique=True)
         await self.db.sequences.create_index("name", unique=True)
 
     async def close(self):
         self.client.close()
 
-    async def get_entry(self, entry_id: str) -> Optional[dict]:
-        return await self.db.entries.find_one({"id": entry_id})
+    async def _get_revisions(
+        self, collection: AsyncIOMotorCollection, owner: str, ids: list[str]
+    ) -> dict[str, int]:
+        if not ids:
+            return {}
+        cursor = collection.find(
+            {"owner": owner, "id": {"$in": ids}}, {"_id": 0, "id": 1, "revision": 1}
+        )
+        revisions = {doc["id"]: doc.get("revision", 0) async for doc in cursor}
+        if revisions:
+            self._observe(owner, max(revision or 0 for revision in revisions.values()))
+        return revisions
+
+    def _observe(self, owner: str, revision: int) -> None:
+        """Make revisions issued here from now on exceed a stored ``revision``.
+
+        Only needed where this worker can be behind the others: an HLC clock
+        running slow, or a lease older than one another worker wrote from.
+        """
+        if self.clock:
+            self.clock.observe(revision)
+            return
+        lease = self._leases.get(owner) if self.revision_lease_size else None
+        if lease and revision >= lease.next:
+            # Stop issuing from this lease; the next one starts past every
+            # revision handed out so far.
+            lease.issue_until = 0.0
+
+    async def _bulk_replace(
+        self,
+        collection: AsyncIOMotorCollection,
+        models: list,
+        expected: Optional[dict[str, Optional[int]]] = None,
+    ) -> set[str]:
+        """Upsert ``models`` unless the stored copy is newer; return the ids not written.
+
+        A stored document is only replaced while its revision is below the
+        new one and at most ``expected[id]``, the revision the writer last
+        saw (None accepts any). When that check fails the upsert turns into
+        an insert, which the unique (owner, id) index rejects, so the outcome
+        comes back with the write instead of needing a read beforehand.
+        Revisions changed by re-stamping are copied back onto ``models``.
+        """
+        # Unordered bulk writes may apply in any order, so only the last
+        # document per id is sent.
+        latest = list({(model.owner, model.id): model for model in models}.values())
+        if not latest:
+            return set()
+        docs = [model.dict() for model in latest]
+
+        requests = []
+        for doc in docs:
+            limit = doc["revision"] - 1
+            if expected and expected.get(doc["id"]) is not None:
+                limit = min(limit, expected[doc["id"]])
+            condition = {
+                "owner": doc["owner"],
+                "id": doc["id"],
+                "$or": [{"revision": {"$lte": limit}}, {"revision": None}],
+            }
+            requests.append(ReplaceOne(condition, doc, upsert=True))
+
+        failed = set()
+        try:
+            await collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as exc:
+            errors = exc.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            failed = {docs[error["index"]]["id"] for error in errors}
+        await self._restamp_late(collection, [doc for doc in docs if doc["id"] not in failed])
+        for model, doc in zip(latest, docs):
+            model.revision = doc["revision"]
+        return failed
+
+    def _lease_times(self, owner: str, revision: int) -> Optional[tuple[float, float]]:
+        """(deadline, expires) of the lease ``revision`` came from, if still tracked."""
+        lease = self._leases.get(owner)
+        for start, end, deadline, expires in lease.deadlines if lease else ():
+            if start <= revision <= end:
+                return deadline, expires
+        return None
+
+    def _lease_deadline(self, owner: str, revision: int) -> float:
+        times = self._lease_times(owner, revision)
+        # Not from a lease we still track, so it cannot be vouched for.
+        return times[0] if times else float("-inf")
+
+    async def _restamp_late(self, collection: AsyncIOMotorCollection, docs: list[dict]) -> None:
+        """Write again, with fresh revisions, documents whose write was
+        acknowledged after their lease's deadline.
+
+        Readers may already have moved past a lease that ran out while its
+        write was in flight; the fresh revisions put the documents back in
+        front of them. A document rewritten by someone else meanwhile is left
+        alone. HLC revisions need none of this.
+        """
+        if self.clock:
+            return
+        restamped: dict[str, list[int]] = {}
+        try:
+            for _ in range(LATE_WRITE_ATTEMPTS):
+                acked_at = time.monotonic()
+                late = [
+                    doc
+                    for doc in docs
+                    if self._lease_deadline(doc["owner"], doc["revision"]) <= acked_at
+                ]
+                if not late:
+                    return
+                requests = []
+                for owner in {doc["owner"] for doc in late}:
+                    owned = [doc for doc in late if doc["owner"] == owner]
+                    revisions = await self.reserve_revisions(owner, len(owned))
+                    restamped.setdefault(owner, []).extend(revisions)
+                    for doc, revision in zip(owned, revisions):
+                        requests.append(
+                            ReplaceOne(
+                                {"owner": owner, "id": doc["id"], "revision": doc["revision"]},
+                                {**doc, "revision": revision},
+                            )
+                        )
+                        doc["revision"] = revision
+                await collection.bulk_write(requests, ordered=False)
+                docs = late
+            logger.warning("%d documents still written after their revisions expired", len(docs))
+        finally:
+            # Blocks taken for the rewrites are settled only once no longer
+            # needed for the lateness check.
+            for owner, revisions in restamped.items():
+                await self.settle_revisions(owner, revisions)
+
+    async def get_entry(self, owner: str, entry_id: str) -> Optional[dict]:
+        return await self.db.entries.find_one({"owner": owner, "id": entry_id})
 
     async def upsert_entry(self, entry: MongoEntry) -> None:
         await self.db.entries.replace_one(
-            {"id": entry.id},
+            {"owner": entry.owner, "id": entry.id},
             entry.dict(),
             upsert=True,
         )
 
-    async def get_entries_since(self, since: int) -> list[dict]:
-        cursor = self.db.entries.find({"revision": {"$gt": since}})
-        return await cursor.to_list(length=None)
+    async def get_entry_revisions(self, owner: str, entry_ids: list[str]) -> dict[str, int]:
+        return await self._get_revisions(self.db.entries, owner, entry_ids)
+
+    async def bulk_upsert_entries(
+        self, entries: list[MongoEntry], expected: Optional[dict[str, Optional[int]]] = None
+    ) -> set[str]:
+        return await self._bulk_replace(self.db.entries, entries, expected)
+
+    def find_entries_since(
+        self, owner: str, since: int, until: Optional[int] = None
+    ) -> AsyncIOMotorCursor:
+        return self.db.entries.find(
+            _revision_range(owner, since, until), ENTRY_CHANGE_FIELDS
+        ).sort("revision", 1)
+
+    async def get_entries_since(
+        self,
+        owner: str,
+        since: int,
+        limit: Optional[int] = None,
+        until: Optional[int] = None,
+    ) -> list[dict]:
+        cursor = self.find_entries_since(owner, since, until)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def upgrade_entry_payloads(
+        self, owner: str, upgrades: list[tuple[str, str, bytes]]
+    ) -> None:
+        """Rewrite legacy base64 payloads as binary, given (id, old text, bytes).
 
-    async def get_attachment_meta(self, attachment_id: str) -> Optional[dict]:
-        return await self.db.attachments_meta.find_one({"id": attachment_id})
+        An entry whose payload changed since it was read is left alone.
+        """
+        if not upgrades:
+            return
+        await self.db.entries.bulk_write(
+            [
+                UpdateOne(
+                    {"owner": owner, "id": entry_id, "payload_encrypted": text},
+                    {"$set": {"payload_encrypted": payload}},
+                )
+                for entry_id, text, payload in upgrades
+            ],
+            ordered=False,
+        )
+
+    async def get_attachment_meta(self, owner: str, attachment_id: str) -> Optional[dict]:
+        return await self.db.attachments_meta.find_one({"owner": owner, "id": attachment_id})
 
     async def upsert_attachment_meta(self, meta: MongoAttachmentMeta) -> None:
         await self.db.attachments_meta.replace_one(
-            {"id": meta.id},
+            {"owner": meta.owner, "id": meta.id},
             meta.dict(),
             upsert=True,
         )
 
-    async def get_attachments_meta_since(self, since: int) -> list[dict]:
-        cursor = self.db.attachments_meta.find({"revision": {"$gt": since}})
-        return await cursor.to_list(length=None)
+    async def get_attachment_meta_revisions(
+        self, owner: str, attachment_ids: list[str]
+    ) -> dict[str, int]:
+        return await self._get_revisions(self.db.attachments_meta, owner, attachment_ids)
+
+    async def get_attachment_meta_hashes(
+        self, owner: str, attachment_ids: list[str]
+    ) -> dict[str, str]:
+        if not attachment_ids:
+            return {}
+        cursor = self.db.attachments_meta.find(
+            {"owner": owner, "id": {"$in": attachment_ids}},
+            {"_id": 0, "id": 1, "sha256": 1},
+        )
+        return {doc["id"]: doc["sha256"] async for doc in cursor}
+
+    async def bulk_upsert_attachments_meta(
+        self,
+        metas: list[MongoAttachmentMeta],
+        expected: Optional[dict[str, Optional[int]]] = None,
+    ) -> set[str]:
+        return await self._bulk_replace(self.db.attachments_meta, metas, expected)
 
-    async def get_attachment_content(self, attachment_id: str) -> Optional[dict]:
-        return await self.db.attachments_content.find_one({"id": attachment_id})
+    def find_attachments_meta_since(
+        self, owner: str, since: int, until: Optional[int] = None
+    ) -> AsyncIOMotorCursor:
+        return self.db.attachments_meta.find(
+            _revision_range(owner, since, until), ATTACHMENT_META_CHANGE_FIELDS
+        ).sort("revision", 1)
+
+    async def get_attachments_meta_since(
+        self,
+        owner: str,
+        since: int,
+        limit: Optional[int] = None,
+        until: Optional[int] = None,
+    ) -> list[dict]:
+        cursor = self.find_attachments_meta_since(owner, since, until)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def get_attachment_content(self, owner: str, attachment_id: str) -> Optional[dict]:
+        return await self.db.attachments_content.find_one({"owner": owner, "id": attachment_id})
+
+    async def get_existing_attachment_ids(
+        self, owner: str, attachment_ids: list[str]
+    ) -> set[str]:
+        if not attachment_ids:
+            return set()
+        linked = self.db.attachment_refs.find(
+            {"owner": owner, "id": {"$in": attachment_ids}}, {"_id": 0, "id": 1}
+        )
+        existing = {doc["id"] async for doc in linked}
+
+        # Attachments stored before content addressing: GridFS files named by
+        # attachment id, and before that single attachments_content documents.
+        unlinked = [att_id for att_id in attachment_ids if att_id not in existing]
+        if unlinked:
+            files = self.db["attachments.files"].find(
+                {"filename": {"$in": unlinked}, "metadata.owner": owner},
+                {"_id": 0, "filename": 1},
+            )
+            existing.update([doc["filename"] async for doc in files])
+            legacy = self.db.attachments_content.find(
+                {"owner": owner, "id": {"$in": unlinked}}, {"_id": 0, "id": 1}
+            )
+            existing.update([doc["id"] async for doc in legacy])
+        return existing
+
+    async def get_attachment_blob_ref(self, owner: str, attachment_id: str) -> Optional[str]:
+        ref = await self.db.attachment_refs.find_one(
+            {"owner": owner, "id": attachment_id}, {"_id": 0, "sha256": 1}
+        )
+        return ref["sha256"] if ref else None
+
+    async def get_owned_blob_hashes(self, owner: str, hashes: list[str]) -> set[str]:
+        """The digests among ``hashes`` that ``owner``'s own attachments point at."""
+        if not hashes:
+            return set()
+        cursor = self.db.attachment_refs.find(
+            {"owner": owner, "sha256": {"$in": hashes}}, {"_id": 0, "sha256": 1}
+        )
+        return {doc["sha256"] async for doc in cursor}
+
+    async def register_attachment_blob(self, sha256: str, size: int) -> None:
+        await self.db.attachment_blobs.update_one(
+            {"sha256": sha256},
+            {"$setOnInsert": {"size": size, "refs": 0}},
+            upsert=True,
+        )
+
+    async def link_attachment_blob(
+        self, owner: str, attachment_id: str, sha256: str, revive: bool = False
+    ) -> tuple[bool, Optional[str]]:
+        """Point ``owner``'s ``attachment_id`` at the registered blob ``sha256``.
+
+        Returns whether the blob exists and the digest the attachment pointed
+        at before, whose reference the caller should release. A blob whose
+        file is being deleted cannot gain references; with ``revive``, one
+        whose deletion was abandoned long ago can, for a caller that is about
+        to write the file back.
+        """
+        condition: dict = {"sha256": sha256, "deleting": None}
+        if revive:
+            abandoned = datetime.utcnow() - timedelta(seconds=ABANDONED_BLOB_DELETE_SECONDS)
+            condition = {
+                "sha256": sha256,
+                "$or": [{"deleting": None}, {"deleting": {"$lt": abandoned}}],
+            }
+        result = await self.db.attachment_blobs.update_one(
+            condition, {"$inc": {"refs": 1}, "$unset": {"deleting": ""}}
+        )
+        if not result.matched_count:
+            return False, None
+
+        previous = await self.db.attachment_refs.find_one_and_update(
+            {"owner": owner, "id": attachment_id},
+            {"$set": {"sha256": sha256}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        return True, previous["sha256"] if previous else None
+
+    async def release_attachment_blob(self, sha256: str) -> bool:
+        """Drop one reference to ``sha256``.
+
+        True when the blob is no longer used: it is then marked as deleting,
+        which stops new links, and the caller deletes the file and calls
+        ``forget_attachment_blob``.
+        """
+        blob = await self.db.attachment_blobs.find_one_and_update(
+            {"sha256": sha256},
+            {"$inc": {"refs": -1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not blob or blob["refs"] > 0:
+            return False
+        result = await self.db.attachment_blobs.update_one(
+            {"sha256": sha256, "refs": {"$lte": 0}, "deleting": None},
+            {"$set": {"deleting": datetime.utcnow()}},
+        )
+        return result.modified_count > 0
+
+    async def forget_attachment_blob(self, sha256: str) -> None:
+        await self.db.attachment_blobs.delete_one(
+            {"sha256": sha256, "refs": {"$lte": 0}, "deleting": {"$ne": None}}
+        )
+
+    async def delete_legacy_attachment_content(self, owner: str, attachment_id: str) -> None:
+        await self.db.attachments_content.delete_one({"owner": owner, "id": attachment_id})
+        async for doc in self.db["attachments.files"].find(
+            {"filename": attachment_id, "metadata.owner": owner}, {"_id": 1}
+        ):
+            await self.attachments_fs.delete(doc["_id"])
+
+    async def open_legacy_attachment_blob(
+        self, owner: str, attachment_id: str
+    ) -> Optional[AsyncIOMotorGridOut]:
+        # Legacy files carry their account in metadata.owner (see
+        # scripts/migrate_add_owner.py).
+        doc = await self.db["attachments.files"].find_one(
+            {"filename": attachment_id, "metadata.owner": owner},
+            {"_id": 1},
+            sort=[("uploadDate", -1)],
+        )
+        if doc is None:
+            return None
+        try:
+            return await self.attachments_fs.open_download_stream(doc["_id"])
+        except NoFile:
+            return None
 
     async def upsert_attachment_content(self, content: MongoAttachmentContent) -> None:
         await self.db.attachments_content.replace_one(
-            {"id": content.id},
+            {"owner": content.owner, "id": content.id},
             content.dict(),
             upsert=True,
         )
@@ -78,37 +580,292 @@ class MongoStore:
     async def delete_refresh_token(self, token: str) -> None:
         await self.db.refresh_tokens.delete_one({"token": token})
 
-    async def get_next_revision(self) -> int:
+    async def get_next_revision(self, owner: str) -> int:
+        revisions = await self.reserve_revisions(owner, 1)
+        return revisions[0]
+
+    async def reserve_revisions(self, owner: str, count: int) -> list[int]:
+        """Allocate ``count`` increasing revisions for ``owner``.
+
+        Without leasing this is a single update of the sequence document,
+        which also records the block as open until ``settle_revisions``. In
+        lease mode the block is carved out of a range this worker reserved in
+        advance, and a new lease is only taken when the current one runs out.
+        The HLC source needs no round trip at all.
+        """
+        if count <= 0:
+            return []
+        if self.clock:
+            revisions = self.clock.reserve(count)
+        elif not self.revision_lease_size:
+            requested_at = time.monotonic()
+            end = await self._open_range(owner, count, self.revision_block_ttl)
+            start = end - count + 1
+            tracker = self._leases.setdefault(owner, _RevisionLease())
+            tracker.deadlines.append(
+                (
+                    start,
+                    end,
+                    requested_at + self.revision_block_ttl * 3 / 4,
+                    requested_at + self.revision_block_ttl,
+                )
+            )
+            del tracker.deadlines[:-MAX_TRACKED_RANGES]
+        else:
+            lease = self._leases.setdefault(owner, _RevisionLease())
+            async with lease.lock:
+                exhausted = lease.next + count - 1 > lease.end
+                if exhausted or time.monotonic() >= lease.issue_until:
+                    await self._take_lease(owner, lease, max(count, self.revision_lease_size))
+                start = lease.next
+                lease.next += count
+
+        if not self.clock:
+            revisions = list(range(start, start + count))
+
+        # Listeners hear about revisions before anything is written with them.
+        for listener in self.revision_listeners:
+            await listener(owner, revisions)
+        return revisions
+
+    async def _open_range(self, owner: str, size: int, ttl: float) -> int:
+        """Advance the counter by ``size``, recording the range as open for
+        ``ttl`` seconds; return the new counter value."""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+        value = {"$ifNull": ["$value", 0]}
+        # The range and its record are written in the same update, so a
+        # reader can never see the advanced counter without the open range.
         sequence = await self.db.sequences.find_one_and_update(
-            {"name": "_id"},
-            {"$inc": {"value": 1}},
+            _sequence(owner),
+            [
+                {
+                    "$set": {
+                        "value": {"$add": [value, size]},
+                        "leases": {
+                            "$concatArrays": [
+                                {
+                                    "$filter": {
+                                        "input": {"$ifNull": ["$leases", []]},
+                                        "cond": {"$gt": ["$$this.expires_at", now]},
+                                    }
+                                },
+                                [
+                                    {
+                                        "start": {"$add": [value, 1]},
+                                        "expires_at": expires_at,
+                                    }
+                                ],
+                            ]
+                        },
+                    }
+                }
+            ],
             upsert=True,
-            return_document=True,
+            return_document=ReturnDocument.AFTER,
         )
-        if sequence:
-            return sequence["value"]
-        else:
-            await self.db.sequences.insert_one({"name": "_id", "value": 1})
-            return 1
+        return sequence["value"]
+
+    async def settle_revisions(self, owner: str, revisions: list[int]) -> Optional[int]:
+        """Close the blocks ``revisions`` were reserved in, once written.
+
+        Returns the read horizon afterwards, which is what readers can now
+        see, or None where revisions are not reserved in blocks (leasing and
+        HLC).
+        """
+        if self.clock or self.revision_lease_size or not revisions:
+            return None
+        tracker = self._leases.get(owner)
+        if tracker:
+            settled = set(revisions)
+            tracker.deadlines = [d for d in tracker.deadlines if d[0] not in settled]
+        sequence = await self.db.sequences.find_one_and_update(
+            _sequence(owner),
+            {"$pull": {"leases": {"start": {"$in": revisions}}}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return _open_horizon(sequence)
+
+    async def _take_lease(self, owner: str, lease: _RevisionLease, size: int) -> None:
+        requested_at = time.monotonic()
+        end = await self._open_range(owner, size, self.revision_lease_ttl)
+        # Readers treat the lease as open until expires_at. Revisions are only
+        # issued during the first half of that window; the rest is headroom for
+        # writes that were handed a revision to land before readers move past it.
+        # Readers judge expiry by their own clock, so the last quarter is kept
+        # back for clock skew between hosts: a write acknowledged later than
+        # that is re-stamped (see _restamp_late).
+        lease.end = end
+        lease.next = lease.end - size + 1
+        lease.issue_until = time.monotonic() + self.revision_lease_ttl / 2
+        lease.deadlines.append(
+            (
+                lease.next,
+                lease.end,
+                requested_at + self.revision_lease_ttl * 3 / 4,
+                requested_at + self.revision_lease_ttl,
+            )
+        )
+        del lease.deadlines[:-8]
+
+    async def get_read_horizon(self, owner: str) -> int:
+        """Highest revision safe to expose to readers.
+
+        With sequence revisions it is the revision just below the oldest
+        block or lease that may still have writes in flight; this relies on
+        the hosts' clocks agreeing to within a quarter of the block or lease
+        TTL, and writes that outlive it are re-stamped above it. With HLC
+        revisions
+        it trails the wall clock by ``hlc_read_delay``, which must exceed the
+        clock skew between nodes plus the time a push takes to write.
+        """
+        if self.clock:
+            return self.clock.bound(-self.hlc_read_delay)
+        return _open_horizon(await self.db.sequences.find_one(_sequence(owner)))
 
-    async def get_latest_revision(self) -> int:
-        sequence = await self.db.sequences.find_one({"name": "_id"})
+    def readable_in(self, owner: str, revision: int) -> float:
+        """Seconds until ``revision``, written by this worker, is under every
+        reader's read horizon."""
+        if self.clock:
+            return max(0.0, self.clock.seconds_until(revision) + self.hlc_read_delay)
+        if not self.revision_lease_size:
+            return 0.0
+        # Leases that hold the revision back start at or below it, so none
+        # expires later than the one it came from; readers' clocks may lag
+        # ours by up to a quarter of the TTL.
+        times = self._lease_times(owner, revision)
+        expires = times[1] if times else time.monotonic() + self.revision_lease_ttl
+        return max(0.0, expires - time.monotonic() + self.revision_lease_ttl / 4)
+
+    async def get_latest_revision(self, owner: str) -> int:
+        if self.clock:
+            # Not tracked per owner; this bounds anything a node whose clock
+            # is within the read delay of ours can have issued.
+            return self.clock.bound(self.hlc_read_delay)
+        sequence = await self.db.sequences.find_one(_sequence(owner))
         return sequence["value"] if sequence else 0
 
-    async def get_journal(self, journal_id: str) -> Optional[dict]:
-        return await self.db.journals.find_one({"id": journal_id})
+    async def get_compacted_through(self, owner: str) -> int:
+        """Highest revision whose tombstones may have been hard-deleted."""
+        sequence = await self.db.sequences.find_one(
+            _sequence(owner), {"_id": 0, "compacted_through": 1}
+        )
+        return (sequence or {}).get("compacted_through", 0)
+
+    async def compact_tombstones(
+        self, deleted_before: datetime, batch_size: int = 1000
+    ) -> tuple[int, int]:
+        """Hard-delete tombstones the server wrote before ``deleted_before``.
+
+        Tombstones are aged by ``deleted_seen_at``, not by the client-supplied
+        ``deleted_at``. Each account's watermark is raised before its
+        documents in a batch are removed, so no reader can miss a tombstone
+        without also seeing a watermark that covers it. Returns (documents
+        removed, accounts whose watermark moved).
+        """
+        removed = 0
+        owners = set()
+        for collection in (self.db.entries, self.db.attachments_meta, self.db.journals):
+            # Tombstones written before deleted_seen_at existed start their
+            # retention period now.
+            await collection.update_many(
+                {"deleted_at": {"$type": "date"}, "deleted_seen_at": None},
+                {"$set": {"deleted_seen_at": datetime.utcnow()}},
+            )
+            expired = {"deleted_seen_at": {"$lt": deleted_before}}
+            last_id = None
+            while True:
+                page = dict(expired)
+                if last_id is not None:
+                    page["_id"] = {"$gt": last_id}
+                cursor = (
+                    collection.find(page, {"_id": 1, "owner": 1, "revision": 1})
+                    .sort("_id", 1)
+                    .limit(batch_size)
+                )
+                docs = await cursor.to_list(length=batch_size)
+                if not docs:
+                    break
+                last_id = docs[-1]["_id"]
+                watermarks: dict[str, int] = {}
+                for doc in docs:
+                    owner = doc["owner"]
+                    watermarks[owner] = max(watermarks.get(owner, 0), doc.get("revision") or 0)
+                await self.db.sequences.bulk_write(
+                    [
+                        UpdateOne(
+                            _sequence(owner),
+                            {"$max": {"compacted_through": watermark}},
+                            upsert=True,
+                        )
+                        for owner, watermark in watermarks.items()
+                    ],
+                    ordered=False,
+                )
+                owners.update(watermarks)
+                # Re-checking the filter skips documents revived or re-deleted
+                # since they were read.
+                result = await collection.delete_many(
+                    {
+                        "_id": {"$in": [doc["_id"] for doc in docs]},
+                        "$or": [
+                            {"owner": owner, "revision": {"$lte": watermark}}
+                            for owner, watermark in watermarks.items()
+                        ],
+                        **expired,
+                    }
+                )
+                removed += result.deleted_count
+        return removed, len(owners)
+
+    async def get_snapshot(self, owner: str) -> Optional[dict]:
+        return await self.db.snapshots.find_one({"_id": owner})
+
+    async def save_snapshot(self, owner: str, snapshot: dict) -> None:
+        await self.db.snapshots.replace_one({"_id": owner}, snapshot, upsert=True)
+
+    async def get_journal(self, owner: str, journal_id: str) -> Optional[dict]:
+        return await self.db.journals.find_one({"owner": owner, "id": journal_id})
 
     async def upsert_journal(self, journal: MongoJournal) -> None:
+        doc = journal.dict()
         await self.db.journals.replace_one(
-            {"id": journal.id},
-            journal.dict(),
-            upsert=True,
+            {"owner": journal.owner, "id": journal.id}, doc, upsert=True
         )
+        await self._restamp_late(self.db.journals, [doc])
+        journal.revision = doc["revision"]
 
-    async def get_journals_since(self, since: int) -> list[dict]:
-        cursor = self.db.journals.find({"revision": {"$gt": since}})
-        return await cursor.to_list(length=None)
+    async def get_journal_revisions(
+        self, owner: str, journal_ids: list[str]
+    ) -> dict[str, int]:
+        return await self._get_revisions(self.db.journals, owner, journal_ids)
+
+    async def bulk_upsert_journals(
+        self,
+        journals: list[MongoJournal],
+        expected: Optional[dict[str, Optional[int]]] = None,
+    ) -> set[str]:
+        return await self._bulk_replace(self.db.journals, journals, expected)
+
+    def find_journals_since(
+        self, owner: str, since: int, until: Optional[int] = None
+    ) -> AsyncIOMotorCursor:
+        return self.db.journals.find(
+            _revision_range(owner, since, until), JOURNAL_CHANGE_FIELDS
+        ).sort("revision", 1)
+
+    async def get_journals_since(
+        self,
+        owner: str,
+        since: int,
+        limit: Optional[int] = None,
+        until: Optional[int] = None,
+    ) -> list[dict]:
+        cursor = self.find_journals_since(owner, since, until)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=limit)
 
-    async def get_all_journals(self) -> list[dict]:
-        cursor = self.db.journals.find({"deleted_at": None})
+    async def get_all_journals(self, owner: str) -> list[dict]:
+        cursor = self.db.journals.find({"owner": owner, "deleted_at": None})
         return await cursor.to_list(length=None)
@@ -1,7 +1,43 @@
 import redis.asyncio as redis
-from typing import Optional, Any
+from typing import AsyncIterator, Optional, Any
 import json
 
+# Values are compared as decimal strings, not with tonumber: Lua numbers are
+# doubles, which cannot tell apart 64-bit HLC revisions a few units apart.
+_SET_MAX_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+local value = ARGV[1]
+if not current or #value > #current or (#value == #current and value > current) then
+    redis.call('SET', KEYS[1], value)
+    return value
+end
+return current
+"""
+
+# Compare-and-act scripts for keys holding a claim token: only the holder of
+# the token may release, extend or replace it.
+_DELETE_IF_EQUALS_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_EXPIRE_IF_EQUALS_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_REPLACE_IF_EQUALS_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
 
 class RedisCache:
     def __init__(self, redis_url: str):
@@ -25,6 +61,59 @@ class RedisCache:
             return await self.client.set(key, value, ex=expire)
         return False
 
+    async def set_if_absent(self, key: str, value: str, expire: Optional[int] = None) -> bool:
+        if self.client:
+            return bool(await self.client.set(key, value, ex=expire, nx=True))
+        return False
+
+    async def set_max(self, key: str, value: int) -> Optional[int]:
+        """Raise an integer key to ``value`` unless it already holds more; return the result."""
+        if self.client:
+            result = await self.client.eval(_SET_MAX_SCRIPT, 1, key, str(int(value)))
+            return int(result)
+        return None
+
+    async def delete_if_equals(self, key: str, value: str) -> bool:
+        """Delete ``key`` only while it still holds ``value``."""
+        if self.client:
+            return bool(await self.client.eval(_DELETE_IF_EQUALS_SCRIPT, 1, key, value))
+        return False
+
+    async def expire_if_equals(self, key: str, value: str, seconds: int) -> bool:
+        """Reset the TTL of ``key`` only while it still holds ``value``."""
+        if self.client:
+            return bool(await self.client.eval(_EXPIRE_IF_EQUALS_SCRIPT, 1, key, value, seconds))
+        return False
+
+    async def replace_if_equals(self, key: str, expected: str, value: str, expire: int) -> bool:
+        """Overwrite ``key`` with ``value`` only while it still holds ``expected``."""
+        if self.client:
+            return bool(
+                await self.client.eval(_REPLACE_IF_EQUALS_SCRIPT, 1, key, expected, value, expire)
+            )
+        return False
+
+    async def incr(self, key: str) -> Optional[int]:
+        if self.client:
+            return await self.client.incr(key)
+        return None
+
+    async def zincrby(self, key: str, amount: float, member: str) -> Optional[float]:
+        if self.client:
+            return await self.client.zincrby(key, amount, member)
+        return None
+
+    async def zscore(self, key: str, member: str) -> Optional[float]:
+        if self.client:
+            return await self.client.zscore(key, member)
+        return None
+
+    async def zrangebyscore(self, key: str, min_score: float) -> list[str]:
+        """Members scoring at least ``min_score``."""
+        if self.client:
+            return await self.client.zrangebyscore(key, min_score, "+inf")
+        return []
+
     async def delete(self, key: str) -> bool:
         if self.client:
             return await self.client.delete(key) > 0
@@ -51,3 +140,20 @@ class RedisCache:
         if self.client:
             return await self.client.expire(key, seconds)
         return False
+
+    async def publish(self, channel: str, message: str) -> int:
+        if self.client:
+            return await self.client.publish(channel, message)
+        return 0
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        """Yield messages published on ``channel`` until the caller stops iterating."""
+        if not self.client:
+            return
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(channel)
+            async for message in pubsub.listen():
+                yield message["data"]
+        finally:
+            await pubsub.aclose()
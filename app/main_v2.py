@@ -16,8 +16,28 @@ async def lifespan(app: FastAPI):
     mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
     db_name = os.getenv("MONGODB_DB_NAME", "journal_db")
     redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-
-    await init_databases(mongodb_url, db_name, redis_url)
+    revision_lease_size = int(os.getenv("REVISION_LEASE_SIZE", "0"))
+    revision_lease_ttl = float(os.getenv("REVISION_LEASE_TTL", "2.0"))
+    revision_block_ttl = float(os.getenv("REVISION_BLOCK_TTL", "30"))
+    revision_source = os.getenv("REVISION_SOURCE", "sequence")
+    hlc_node_id = os.getenv("HLC_NODE_ID")
+    hlc_read_delay = float(os.getenv("HLC_READ_DELAY", "1.0"))
+    attachment_storage = os.getenv("ATTACHMENT_STORAGE", "mongo")
+    attachment_storage_path = os.getenv("ATTACHMENT_STORAGE_PATH", "/data/attachments")
+
+    await init_databases(
+        mongodb_url,
+        db_name,
+        redis_url,
+        revision_lease_size=revision_lease_size,
+        revision_lease_ttl=revision_lease_ttl,
+        revision_block_ttl=revision_block_ttl,
+        revision_source=revision_source,
+        hlc_node_id=int(hlc_node_id) if hlc_node_id else None,
+        hlc_read_delay=hlc_read_delay,
+        attachment_storage=attachment_storage,
+        attachment_storage_path=attachment_storage_path,
+    )
 
     yield
 
@@ -1,21 +1,27 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Union
 
 
 class MongoEntry(BaseModel):
+    owner: str
     id: str
     journal_id: str
-    payload_encrypted: str
+    # Binary; strings are legacy documents or payloads that were not base64.
+    payload_encrypted: Union[bytes, str]
     payload_version: int
     attachment_ids: list[str]
     created_at: datetime
     updated_at: datetime
     deleted_at: Optional[datetime] = None
+    # Server time the tombstone was written; compaction ages tombstones by
+    # this, since deleted_at comes from the client.
+    deleted_seen_at: Optional[datetime] = None
     revision: Optional[int] = None
 
 
 class MongoAttachmentMeta(BaseModel):
+    owner: str
     id: str
     sha256: str
     size_bytes: int
@@ -23,10 +29,14 @@ class MongoAttachmentMeta(BaseModel):
     created_at: datetime
     updated_at: datetime
     deleted_at: Optional[datetime] = None
+    # Server time the tombstone was written; compaction ages tombstones by
+    # this, since deleted_at comes from the client.
+    deleted_seen_at: Optional[datetime] = None
     revision: Optional[int] = None
 
 
 class MongoAttachmentContent(BaseModel):
+    owner: str
     id: str
     content: bytes
 
@@ -39,12 +49,16 @@ class MongoRefreshToken(BaseModel):
 
 
 class MongoJournal(BaseModel):
+    owner: str
     id: str
     name: str
     color: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     deleted_at: Optional[datetime] = None
+    # Server time the tombstone was written; compaction ages tombstones by
+    # this, since deleted_at comes from the client.
+    deleted_seen_at: Optional[datetime] = None
     revision: Optional[int] = None
 
 
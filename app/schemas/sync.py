@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Union
 
 from pydantic import BaseModel, Field
 from app.schemas.journal import JournalChange
@@ -8,7 +8,9 @@ from app.schemas.journal import JournalChange
 class EntryChange(BaseModel):
     id: str = Field(..., description="UUID")
     journalId: str = Field(..., description="Journal UUID")
-    payloadEncrypted: str
+    payloadEncrypted: Union[str, bytes] = Field(
+        ..., description="Base64 ciphertext; raw bytes in the msgpack protocol."
+    )
     payloadVersion: int
     attachmentIds: List[str] = []
     createdAt: datetime
@@ -35,6 +37,10 @@ class SyncChangesResponse(BaseModel):
     entries: List[EntryChange]
     attachments: List[AttachmentMeta]
     journals: List[JournalChange] = []
+    hasMore: bool = False
+    nextSince: Optional[int] = Field(
+        None, description="Pass as `since` to fetch the next page."
+    )
 
 
 class PushRequest(BaseModel):
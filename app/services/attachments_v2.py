@@ -1,25 +1,87 @@
+from typing import AsyncIterator, Optional
+
 from fastapi import status
 
 from app.core.errors import http_error
+from app.database.blobs import BlobBody, BlobStore, BytesBody, GridFSBody
 from app.database.mongo import MongoStore
 
 
 class AttachmentService:
-    def __init__(self, store: MongoStore):
+    def __init__(self, store: MongoStore, blobs: BlobStore):
         self.store = store
+        self.blobs = blobs
 
-    async def upload(self, attachment_id: str, content: bytes) -> None:
-        from app.models.mongo import MongoAttachmentContent
-        from datetime import datetime
+    async def upload(
+        self, owner: str, attachment_id: str, chunks: AsyncIterator[bytes]
+    ) -> None:
+        blob = await self.blobs.stage(chunks)
+        try:
+            await self.store.register_attachment_blob(blob.sha256, blob.size)
+            linked = await self.link(owner, attachment_id, blob.sha256, revive=True)
+        except BaseException:
+            await blob.discard()
+            raise
+        if not linked:
+            await blob.discard()
+            # The stored copy of the same content is being deleted; once it
+            # is gone the client's retry stores it afresh.
+            raise http_error(
+                code="ATTACHMENT_UPLOAD_CONFLICT",
+                message="Attachment content was removed during upload; retry the upload.",
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+        # Our reference keeps the blob from being deleted from here on. Only
+        # now is our copy committed, so a file deleted by a release that
+        # finished before we linked is written back.
+        await blob.commit()
 
-        mongo_content = MongoAttachmentContent(
-            id=attachment_id,
-            content=content,
+    async def link(
+        self, owner: str, attachment_id: str, sha256: str, revive: bool = False
+    ) -> bool:
+        """Point an attachment at an already stored blob; False if there is none."""
+        linked, previous = await self.store.link_attachment_blob(
+            owner, attachment_id, sha256, revive
         )
-        await self.store.upsert_attachment_content(mongo_content)
+        if not linked:
+            return False
+
+        if previous is None:
+            await self.store.delete_legacy_attachment_content(owner, attachment_id)
+        elif await self.store.release_attachment_blob(previous):
+            await self.blobs.delete(previous)
+            await self.store.forget_attachment_blob(previous)
+        return True
+
+    async def link_existing(self, owner: str, attachment_id: str, sha256: str) -> bool:
+        """Attach a blob the account already stores by digest, so the client can
+        skip the upload; False if the account holds no such content."""
+        sha256 = sha256.lower()
+        if not await self.store.get_owned_blob_hashes(owner, [sha256]):
+            return False
+        return await self.link(owner, attachment_id, sha256)
+
+    async def get_etag(self, owner: str, attachment_id: str) -> Optional[str]:
+        sha256 = await self.store.get_attachment_blob_ref(owner, attachment_id)
+        if not sha256:
+            meta = await self.store.get_attachment_meta(owner, attachment_id)
+            sha256 = meta.get("sha256") if meta else None
+        return f'"{sha256}"' if sha256 else None
+
+    async def download(self, owner: str, attachment_id: str) -> BlobBody:
+        sha256 = await self.store.get_attachment_blob_ref(owner, attachment_id)
+        body = await self.blobs.open(sha256) if sha256 else None
+        if body is not None:
+            return body
+
+        # Attachments uploaded before content addressing are stored in GridFS
+        # under their own id, and before chunked storage in a single document.
+        grid_out = await self.store.open_legacy_attachment_blob(owner, attachment_id)
+        if grid_out is not None:
+            return GridFSBody(grid_out)
 
-    async def download(self, attachment_id: str) -> bytes:
-        doc = await self.store.get_attachment_content(attachment_id)
+        doc = await self.store.get_attachment_content(owner, attachment_id)
         if not doc:
             raise http_error(
                 code="RESOURCE_NOT_FOUND",
@@ -27,4 +89,4 @@ class AttachmentService:
                 status_code=status.HTTP_404_NOT_FOUND,
             )
 
-        return doc["content"]
+        return BytesBody(doc["content"])
@@ -5,6 +5,7 @@ from typing import Optional
 from fastapi import status
 
 from app.core.errors import http_error
+from app.core.token_cache import access_token_cache
 from app.database.mongo import MongoStore
 from app.database.redis import RedisCache
 from app.schemas.auth import LoginRequest, RefreshRequest, TokenResponse
@@ -29,7 +30,7 @@ class AuthService:
         )
         await self.store.create_refresh_token(mongo_token)
 
-        await self.redis.set(f"access_token:{access_token}", "1", expire=3600)
+        await self.redis.set(f"access_token:{access_token}", payload.email, expire=3600)
 
         return TokenResponse(
             accessToken=access_token,
@@ -69,7 +70,7 @@ class AuthService:
         )
         await self.store.create_refresh_token(mongo_token)
 
-        await self.redis.set(f"access_token:{access_token}", "1", expire=3600)
+        await self.redis.set(f"access_token:{access_token}", user_email, expire=3600)
 
         return TokenResponse(
             accessToken=access_token,
@@ -79,3 +80,9 @@ class AuthService:
 
     async def validate_access_token(self, token: str) -> bool:
         return await self.redis.exists(f"access_token:{token}")
+
+    async def revoke_access_token(self, token: str) -> None:
+        """Revoke a token. Other workers may accept it until their cached copy
+        expires (ACCESS_TOKEN_CACHE_TTL)."""
+        await self.redis.delete(f"access_token:{token}")
+        access_token_cache.invalidate(token)
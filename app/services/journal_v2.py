@@ -1,8 +1,14 @@
+import os
+import time
 import uuid
 from datetime import datetime
+from typing import Optional
 
+from app.core.sync_encoding import dumps
 from app.schemas.journal import CreateJournalRequest, UpdateJournalRequest, Journal
 from app.database.mongo import MongoStore
+from app.database.redis import RedisCache
+from app.services.revision_feed import RevisionFeed
 from app.models.mongo import MongoJournal
 from app.core.errors import http_error
 from fastapi import status
@@ -11,13 +17,87 @@ from fastapi import status
 DEFAULT_JOURNAL_UUID = "00000000-0000-0000-0000-000000000001"
 DEFAULT_JOURNAL_NAME = "日常"
 
+JOURNALS_GENERATION_KEY = "journals:generation:{owner}"
+JOURNALS_LIST_KEY = "journals:list:{owner}:{generation}"
+JOURNALS_LIST_CACHE_TTL = int(os.getenv("JOURNALS_LIST_CACHE_TTL", "3600"))
+
+
+class JournalListCache:
+    """Serialized GET /journals bodies in Redis, keyed by owner and a
+    per-owner generation counter.
+
+    Every journal write bumps the generation after it commits, which moves
+    readers on to a new key; old bodies simply expire. A body is stored
+    under the generation read before its journals were, so it can only be
+    older than its key if a write committed meanwhile, and that write's bump
+    has already moved readers past it. Commit order does not matter.
+    """
+
+    def __init__(self, cache: RedisCache):
+        self.cache = cache
+
+    async def generation(self, owner: str) -> int:
+        key = JOURNALS_GENERATION_KEY.format(owner=owner)
+        value = await self.cache.get(key)
+        if value is None:
+            # A lost counter restarts from the clock, above any generation
+            # whose bodies may still be cached.
+            await self.cache.set_if_absent(key, str(time.time_ns() // 1000))
+            value = await self.cache.get(key)
+        return int(value) if value is not None else 0
+
+    async def invalidate(self, owner: str) -> None:
+        """Call after every committed journal write."""
+        await self.cache.incr(JOURNALS_GENERATION_KEY.format(owner=owner))
+
+    async def get(self, owner: str, generation: int) -> Optional[str]:
+        return await self.cache.get(
+            JOURNALS_LIST_KEY.format(owner=owner, generation=generation)
+        )
+
+    async def set(self, owner: str, generation: int, body: str) -> None:
+        await self.cache.set(
+            JOURNALS_LIST_KEY.format(owner=owner, generation=generation),
+            body,
+            expire=JOURNALS_LIST_CACHE_TTL,
+        )
+
+
+def _journal_item(doc: dict) -> dict:
+    # Same shape as Journal; naive datetimes encode exactly like isoformat().
+    return {
+        "id": doc["id"],
+        "name": doc["name"],
+        "color": doc.get("color"),
+        "createdAt": doc["created_at"],
+        "updatedAt": doc["updated_at"],
+        "deletedAt": doc.get("deleted_at"),
+        "revision": doc.get("revision"),
+    }
+
 
 class JournalService:
-    def __init__(self, store: MongoStore):
+    def __init__(
+        self, store: MongoStore, revision_feed: RevisionFeed, list_cache: JournalListCache
+    ):
         self.store = store
+        self.revision_feed = revision_feed
+        self.list_cache = list_cache
 
-    async def get_default_journal(self) -> Journal:
-        default_journal = await self.store.get_journal(DEFAULT_JOURNAL_UUID)
+    async def _committed(self, owner: str, revision: int, reserved: int) -> None:
+        """Call once a write with the ``reserved`` revision has committed; it
+        may carry a later ``revision`` if it was re-stamped."""
+        await self.list_cache.invalidate(owner)
+        visible = await self.store.settle_revisions(owner, [reserved])
+        if visible is not None:
+            await self.revision_feed.announce(owner, visible)
+        else:
+            await self.revision_feed.announce(
+                owner, revision, delay=self.store.readable_in(owner, revision)
+            )
+
+    async def get_default_journal(self, owner: str) -> Journal:
+        default_journal = await self.store.get_journal(owner, DEFAULT_JOURNAL_UUID)
         if default_journal:
             deleted_at = default_journal.get("deleted_at")
             return Journal(
@@ -30,12 +110,13 @@ class JournalService:
                 revision=default_journal.get("revision"),
             )
 
-        return await self._create_default_journal()
+        return await self._create_default_journal(owner)
 
-    async def _create_default_journal(self) -> Journal:
-        revision = await self.store.get_next_revision()
+    async def _create_default_journal(self, owner: str) -> Journal:
+        revision = await self.store.get_next_revision(owner)
         now = datetime.utcnow()
         journal = MongoJournal(
+            owner=owner,
             id=DEFAULT_JOURNAL_UUID,
             name=DEFAULT_JOURNAL_NAME,
             color=None,
@@ -45,6 +126,7 @@ class JournalService:
             revision=revision,
         )
         await self.store.upsert_journal(journal)
+        await self._committed(owner, journal.revision, revision)
         return Journal(
             id=journal.id,
             name=journal.name,
@@ -55,12 +137,13 @@ class JournalService:
             revision=journal.revision,
         )
 
-    async def create_journal(self, payload: CreateJournalRequest) -> Journal:
-        revision = await self.store.get_next_revision()
+    async def create_journal(self, owner: str, payload: CreateJournalRequest) -> Journal:
+        revision = await self.store.get_next_revision(owner)
         now = datetime.utcnow()
         journal_id = str(uuid.uuid4())
 
         journal = MongoJournal(
+            owner=owner,
             id=journal_id,
             name=payload.name,
             color=payload.color,
@@ -70,6 +153,7 @@ class JournalService:
             revision=revision,
         )
         await self.store.upsert_journal(journal)
+        await self._committed(owner, journal.revision, revision)
 
         return Journal(
             id=journal.id,
@@ -82,9 +166,9 @@ class JournalService:
         )
 
     async def update_journal(
-        self, journal_id: str, payload: UpdateJournalRequest
+        self, owner: str, journal_id: str, payload: UpdateJournalRequest
     ) -> Journal:
-        existing = await self.store.get_journal(journal_id)
+        existing = await self.store.get_journal(owner, journal_id)
         if not existing:
             raise http_error(
                 code="JOURNAL_NOT_FOUND",
@@ -99,19 +183,22 @@ class JournalService:
                 status_code=status.HTTP_400_BAD_REQUEST,
             )
 
-        revision = await self.store.get_next_revision()
+        revision = await self.store.get_next_revision(owner)
         now = datetime.utcnow()
 
         updated_journal = MongoJournal(
+            owner=owner,
             id=journal_id,
             name=payload.name if payload.name is not None else existing["name"],
             color=payload.color if payload.color is not None else existing.get("color"),
             created_at=existing["created_at"],
             updated_at=now,
             deleted_at=existing.get("deleted_at"),
+            deleted_seen_at=existing.get("deleted_seen_at"),
             revision=revision,
         )
         await self.store.upsert_journal(updated_journal)
+        await self._committed(owner, updated_journal.revision, revision)
 
         return Journal(
             id=updated_journal.id,
@@ -125,7 +212,7 @@ class JournalService:
             revision=updated_journal.revision,
         )
 
-    async def delete_journal(self, journal_id: str) -> None:
+    async def delete_journal(self, owner: str, journal_id: str) -> None:
         if journal_id == DEFAULT_JOURNAL_UUID:
             raise http_error(
                 code="DEFAULT_JOURNAL_IMMUTABLE",
@@ -133,7 +220,7 @@ class JournalService:
                 status_code=status.HTTP_400_BAD_REQUEST,
             )
 
-        existing = await self.store.get_journal(journal_id)
+        existing = await self.store.get_journal(owner, journal_id)
         if not existing:
             raise http_error(
                 code="JOURNAL_NOT_FOUND",
@@ -144,33 +231,31 @@ class JournalService:
         if existing.get("deleted_at"):
             return
 
-        revision = await self.store.get_next_revision()
+        revision = await self.store.get_next_revision(owner)
         now = datetime.utcnow()
 
         updated_journal = MongoJournal(
+            owner=owner,
             id=journal_id,
             name=existing["name"],
             color=existing.get("color"),
             created_at=existing["created_at"],
             updated_at=now,
             deleted_at=now,
+            deleted_seen_at=now,
             revision=revision,
         )
         await self.store.upsert_journal(updated_journal)
+        await self._committed(owner, updated_journal.revision, revision)
 
-    async def list_journals(self) -> list[Journal]:
-        journal_docs = await self.store.get_all_journals()
-        return [
-            Journal(
-                id=doc["id"],
-                name=doc["name"],
-                color=doc.get("color"),
-                createdAt=doc["created_at"].isoformat(),
-                updatedAt=doc["updated_at"].isoformat(),
-                deletedAt=doc.get("deleted_at").isoformat()
-                if doc.get("deleted_at")
-                else None,
-                revision=doc.get("revision"),
-            )
-            for doc in journal_docs
-        ]
+    async def list_journals_body(self, owner: str) -> str:
+        """GET /journals response body, served from the cache when it is current."""
+        generation = await self.list_cache.generation(owner)
+        body = await self.list_cache.get(owner, generation)
+        if body is not None:
+            return body
+
+        journal_docs = await self.store.get_all_journals(owner)
+        body = dumps({"journals": [_journal_item(doc) for doc in journal_docs]}).decode()
+        await self.list_cache.set(owner, generation, body)
+        return body
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+from app.database.redis import RedisCache
+
+LATEST_REVISION_KEY = "sync:latest_revision:{owner}"
+COMMITTED_REVISION_KEY = "sync:committed_revision:{owner}"
+REVISION_CHANNEL = "sync:revisions"
+RESUBSCRIBE_DELAY = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class RevisionFeed:
+    """The newest revision handed out to each account by any worker, published in Redis.
+
+    Revisions are published when they are allocated, before the documents
+    that carry them are written, so the published value is never behind the
+    data. A client already at or past it has nothing to fetch.
+
+    Separately, services announce a revision once its documents are committed
+    and readable. Announcements go out on a Redis channel as
+    ``"<owner> <revision>"``; every worker keeps one subscription and wakes
+    its own stream clients from it. The newest announced revision is also
+    kept in Redis so a worker that was not listening can catch up.
+    """
+
+    def __init__(self, cache: RedisCache):
+        self.cache = cache
+        self.committed: dict[str, int] = {}
+        self._changed: dict[str, asyncio.Event] = {}
+        self._delayed: set[asyncio.Task] = set()
+
+    async def publish(self, owner: str, revision: int) -> None:
+        await self.cache.set_max(LATEST_REVISION_KEY.format(owner=owner), revision)
+
+    async def latest(self, owner: str) -> Optional[int]:
+        value = await self.cache.get(LATEST_REVISION_KEY.format(owner=owner))
+        return int(value) if value is not None else None
+
+    async def announce(self, owner: str, revision: int, delay: float = 0.0) -> None:
+        """Tell every worker's stream clients that ``revision`` is committed.
+
+        With a ``delay`` the announcement is sent in the background once that
+        many seconds have passed, for revisions readers cannot see yet
+        (behind the read horizon of HLC revisions or revision leases).
+        """
+        if delay > 0:
+            task = asyncio.create_task(self._announce_later(owner, revision, delay))
+            self._delayed.add(task)
+            task.add_done_callback(self._delayed.discard)
+            return
+        self._advance(owner, revision)
+        try:
+            await self.cache.set_max(COMMITTED_REVISION_KEY.format(owner=owner), revision)
+            await self.cache.publish(REVISION_CHANNEL, f"{owner} {revision}")
+        except Exception:
+            # The write already succeeded; other workers catch up on the next
+            # announcement or when their clients poll.
+            logger.warning("Failed to announce revision %s", revision, exc_info=True)
+
+    async def _announce_later(self, owner: str, revision: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self.announce(owner, revision)
+
+    def _advance(self, owner: str, revision: int) -> None:
+        if revision > self.committed.get(owner, 0):
+            self.committed[owner] = revision
+            changed = self._changed.pop(owner, None)
+            if changed is not None:
+                changed.set()
+
+    async def _catch_up(self, owner: str) -> None:
+        # Anything announced while we were not listening is covered by the
+        # committed high-water mark. The allocation mark would be too early:
+        # it moves before the documents are written.
+        value = await self.cache.get(COMMITTED_REVISION_KEY.format(owner=owner))
+        self._advance(owner, int(value) if value is not None else 0)
+
+    async def listen(self) -> None:
+        """Apply announcements from other workers; runs for the process lifetime."""
+        while True:
+            try:
+                for owner in list(self._changed):
+                    await self._catch_up(owner)
+                async for message in self.cache.subscribe(REVISION_CHANNEL):
+                    owner, _, revision = message.rpartition(" ")
+                    self._advance(owner, int(revision))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Revision subscription lost, resubscribing", exc_info=True)
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    async def watch(
+        self, owner: str, since: int, heartbeat: float
+    ) -> AsyncIterator[Optional[int]]:
+        """Yield each committed revision of ``owner`` newer than ``since``.
+
+        Revisions that arrive together are coalesced into the newest one.
+        ``None`` is yielded after ``heartbeat`` seconds without news so the
+        caller can keep the connection alive.
+        """
+        if owner not in self.committed:
+            await self._catch_up(owner)
+        while True:
+            committed = self.committed.get(owner, 0)
+            if committed > since:
+                since = committed
+                yield since
+                continue
+            changed = self._changed.setdefault(owner, asyncio.Event())
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+import uuid
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+import orjson
+
+from app.core.compression import compress_stream
+from app.core.sync_encoding import dumps
+from app.database.blobs import BlobBody, BlobStore
+from app.database.mongo import MongoStore
+from app.database.redis import RedisCache
+from app.services.sync_v2 import CHANGE_KINDS, change_cursors, merge_by_revision
+
+# Seconds between checks for new changes; 0 disables the background refresh.
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "300"))
+# Revisions that must be allocated to an account before its image is rebuilt.
+SNAPSHOT_MIN_CHANGES = int(os.getenv("SNAPSHOT_MIN_CHANGES", "100"))
+
+SNAPSHOT_LOCK_KEY = "snapshot:lock"
+# Seconds the lock outlives a dead holder; the holder renews it before every
+# account, so this only has to cover one rebuild.
+SNAPSHOT_LOCK_TTL = 600
+# Sorted set of owners scored by revisions allocated since their last image.
+SNAPSHOT_PENDING_KEY = "snapshot:pending"
+
+logger = logging.getLogger(__name__)
+
+
+def _line(kind: str, change: dict) -> bytes:
+    return dumps({"type": kind, "change": change}) + b"\n"
+
+
+async def read_lines(body: BlobBody) -> AsyncIterator[bytes]:
+    """Yield the NDJSON lines of a gzip-compressed snapshot image."""
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    pending = b""
+    async for chunk in body.iter_chunks():
+        pending += decompressor.decompress(chunk)
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+    pending += decompressor.flush()
+    if pending:
+        yield pending
+
+
+class SnapshotService:
+    """Per account, a gzip-compressed NDJSON image of every live document up
+    to a revision.
+
+    The image uses the same lines as the NDJSON form of /sync/changes, minus
+    tombstones, and ends with ``{"type":"end","latestRevision":R}``; a new
+    device loads it and then syncs normally from R. Images are stored as
+    blobs, and each rebuild merges the changes since the previous image into
+    it instead of replaying the whole history.
+    """
+
+    def __init__(self, store: MongoStore, blobs: BlobStore, cache: RedisCache):
+        self.store = store
+        self.blobs = blobs
+        self.cache = cache
+
+    async def current(self, owner: str) -> Optional[dict]:
+        """The snapshot a client may bootstrap from, if there is a usable one."""
+        snapshot = await self.store.get_snapshot(owner)
+        # Deltas from an image older than the compaction watermark would be
+        # refused, so such an image is no use to anyone.
+        compacted_through = await self.store.get_compacted_through(owner)
+        if not snapshot or snapshot["revision"] < compacted_through:
+            return None
+        return snapshot
+
+    async def note_changes(self, owner: str, count: int) -> None:
+        """Count revisions allocated to ``owner`` towards its next rebuild."""
+        await self.cache.zincrby(SNAPSHOT_PENDING_KEY, count, owner)
+
+    async def refresh(self, owner: str) -> Optional[dict]:
+        """Rebuild the image up to the newest readable revision; returns the new
+        snapshot, or None if nothing was readable past the current one."""
+        previous = await self.store.get_snapshot(owner)
+        since = previous["revision"] if previous else 0
+
+        # Below the read horizon no revision is still being written, so the
+        # image cannot miss a push that lands later.
+        until = await self.store.get_read_horizon(owner)
+        if until <= since:
+            return None
+
+        # Tombstones compacted since the previous image can no longer be
+        # applied to it, so start again from scratch.
+        if previous and previous["revision"] < await self.store.get_compacted_through(owner):
+            previous = None
+            since = 0
+
+        lines = self._image(owner, previous, since, until)
+        sha256, size = await self.blobs.write(compress_stream(lines, "gzip"))
+        snapshot = {
+            "revision": until,
+            "sha256": sha256,
+            "size": size,
+            "created_at": datetime.utcnow(),
+            # The image before this one stays until the next rebuild so
+            # downloads already in progress can finish.
+            "previous_sha256": previous["sha256"] if previous else None,
+        }
+        await self.store.save_snapshot(owner, snapshot)
+
+        stale = previous and previous.get("previous_sha256")
+        if stale and stale not in (sha256, snapshot["previous_sha256"]):
+            await self.blobs.delete(stale)
+        return snapshot
+
+    async def _image(
+        self, owner: str, previous: Optional[dict], since: int, until: int
+    ) -> AsyncIterator[bytes]:
+        cursors = change_cursors(self.store, owner, since, until)
+        if previous is None:
+            async for index, doc in merge_by_revision(cursors):
+                if doc.get("deleted_at") is None:
+                    kind, to_change = CHANGE_KINDS[index]
+                    yield _line(kind, to_change(doc))
+        else:
+            # Only the delta is held in memory; the previous image is streamed
+            # through, dropping documents the delta replaces or deletes.
+            delta: dict[tuple[str, str], Optional[bytes]] = {}
+            async for index, doc in merge_by_revision(cursors):
+                kind, to_change = CHANGE_KINDS[index]
+                deleted = doc.get("deleted_at") is not None
+                delta[(kind, doc["id"])] = None if deleted else _line(kind, to_change(doc))
+
+            body = await self.blobs.open(previous["sha256"])
+            if body is None:
+                raise RuntimeError(f"Snapshot blob {previous['sha256']} is missing")
+            async for line in read_lines(body):
+                item = orjson.loads(line)
+                if item["type"] != "end" and (item["type"], item["change"]["id"]) not in delta:
+                    yield line
+            for line in delta.values():
+                if line is not None:
+                    yield line
+
+        yield dumps({"type": "end", "latestRevision": until}) + b"\n"
+
+    async def run(self) -> None:
+        """Keep images current; one worker at a time does the rebuilds."""
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            try:
+                token = uuid.uuid4().hex
+                if await self.cache.set_if_absent(SNAPSHOT_LOCK_KEY, token, SNAPSHOT_LOCK_TTL):
+                    try:
+                        await self._refresh_due(token)
+                    finally:
+                        # Never release a lock another worker took after ours expired.
+                        await self.cache.delete_if_equals(SNAPSHOT_LOCK_KEY, token)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Snapshot refresh failed", exc_info=True)
+
+    async def _refresh_due(self, token: str) -> None:
+        for owner in await self.cache.zrangebyscore(SNAPSHOT_PENDING_KEY, SNAPSHOT_MIN_CHANGES):
+            if not await self.cache.expire_if_equals(SNAPSHOT_LOCK_KEY, token, SNAPSHOT_LOCK_TTL):
+                logger.warning("Snapshot lock lost; leaving the remaining accounts to its holder")
+                return
+            pending = await self.cache.zscore(SNAPSHOT_PENDING_KEY, owner)
+            try:
+                await self.refresh(owner)
+            except Exception:
+                logger.warning("Snapshot refresh failed for %s", owner, exc_info=True)
+                continue
+            # Revisions allocated during the rebuild still count towards the next.
+            await self.cache.zincrby(SNAPSHOT_PENDING_KEY, -(pending or 0), owner)
@@ -1,154 +1,580 @@
-from app.schemas.sync import (
-    AttachmentMeta,
-    EntryChange,
-    PushRequest,
-    PushResponse,
-    SyncChangesResponse,
+import asyncio
+import heapq
+import os
+import time
+import uuid
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi import status
+
+from app.core.errors import http_error
+from app.core.single_flight import SingleFlight
+from app.core.sync_encoding import (
+    MSGPACK_MEDIA_TYPE,
+    attachment_change,
+    dumps,
+    entry_change,
+    journal_change,
+    packb,
+    payload_to_storage,
 )
 from app.schemas.journal import JournalChange
+from app.schemas.sync import AttachmentMeta, EntryChange, PushRequest, PushResponse
 from app.database.mongo import MongoStore
+from app.database.redis import RedisCache
+from app.services.attachments_v2 import AttachmentService
+from app.services.journal_v2 import JournalListCache
+from app.services.revision_feed import RevisionFeed
 from app.models.mongo import MongoEntry, MongoAttachmentMeta, MongoJournal
 
 
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+SYNC_MAX_PAGE_SIZE = int(os.getenv("SYNC_MAX_PAGE_SIZE", "1000"))
+
+# Serialized /sync/changes pages being built in this worker.
+changes_flights = SingleFlight()
+
+
+# Seconds a push response is kept for replay under its Idempotency-Key.
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+# Seconds a duplicate waits for the original request before giving up.
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "30"))
+# Seconds a claimed key stays locked if its worker dies mid-push. A running
+# push keeps extending its claim, however long it takes.
+IDEMPOTENCY_PENDING_TTL = 60
+IDEMPOTENCY_CLAIM_REFRESH = IDEMPOTENCY_PENDING_TTL / 3
+IDEMPOTENCY_KEY = "push:idempotency:{owner}:{key}"
+
+# Rounds of writes for items that lost only to clock skew between HLC nodes.
+PUSH_WRITE_ATTEMPTS = 3
+
+
+def _dedupe(items: list, conflicts: list[str]) -> list:
+    kept: dict[str, object] = {}
+    for item in items:
+        # A later copy of the same id in this push competes with the revision
+        # the earlier copy is about to get, which is newer than anything the
+        # client can have seen. A copy without a revision simply replaces it.
+        if item.id in kept and item.revision is not None:
+            conflicts.append(item.id)
+            continue
+        kept[item.id] = item
+    return list(kept.values())
+
+
+def _seen_at(deleted_at: Optional[datetime]) -> Optional[datetime]:
+    return datetime.utcnow() if deleted_at is not None else None
+
+
+def _entry_doc(owner: str, entry: EntryChange, revision: int) -> MongoEntry:
+    return MongoEntry(
+        owner=owner,
+        id=entry.id,
+        journal_id=entry.journalId,
+        payload_encrypted=payload_to_storage(entry.payloadEncrypted),
+        payload_version=entry.payloadVersion,
+        attachment_ids=entry.attachmentIds,
+        created_at=entry.createdAt,
+        updated_at=entry.updatedAt,
+        deleted_at=entry.deletedAt,
+        deleted_seen_at=_seen_at(entry.deletedAt),
+        revision=revision,
+    )
+
+
+def _attachment_meta_doc(
+    owner: str, meta: AttachmentMeta, revision: int
+) -> MongoAttachmentMeta:
+    return MongoAttachmentMeta(
+        owner=owner,
+        id=meta.id,
+        sha256=meta.sha256,
+        size_bytes=meta.sizeBytes,
+        mime_type=meta.mimeType,
+        created_at=meta.createdAt,
+        updated_at=meta.updatedAt,
+        deleted_at=meta.deletedAt,
+        deleted_seen_at=_seen_at(meta.deletedAt),
+        revision=revision,
+    )
+
+
+def _journal_doc(owner: str, journal: JournalChange, revision: int) -> MongoJournal:
+    return MongoJournal(
+        owner=owner,
+        id=journal.id,
+        name=journal.name,
+        color=journal.color,
+        created_at=journal.createdAt,
+        updated_at=journal.updatedAt,
+        deleted_at=journal.deletedAt,
+        deleted_seen_at=_seen_at(journal.deletedAt),
+        revision=revision,
+    )
+
+
+def _binary_payloads(entry_docs: list[dict]) -> list[tuple[str, str, bytes]]:
+    """Convert legacy base64 payloads in place; return the upgrades to write back."""
+    upgrades = []
+    for doc in entry_docs:
+        text = doc["payload_encrypted"]
+        if isinstance(text, str):
+            payload = payload_to_storage(text)
+            if isinstance(payload, bytes):
+                doc["payload_encrypted"] = payload
+                upgrades.append((doc["id"], text, payload))
+    return upgrades
+
+
+# NDJSON change kinds, in the order of the cursors from change_cursors().
+CHANGE_KINDS = (
+    ("entry", entry_change),
+    ("attachment", attachment_change),
+    ("journal", journal_change),
+)
+
+
+def change_cursors(
+    store: MongoStore, owner: str, since: int, until: Optional[int] = None
+) -> list[AsyncIterator[dict]]:
+    return [
+        store.find_entries_since(owner, since, until),
+        store.find_attachments_meta_since(owner, since, until),
+        store.find_journals_since(owner, since, until),
+    ]
+
+
+def _idle_changes(latest: int, since: int) -> dict:
+    return {
+        "latestRevision": latest,
+        "entries": [],
+        "attachments": [],
+        "journals": [],
+        "hasMore": False,
+        "nextSince": since,
+    }
+
+
+async def _single(chunk: bytes) -> AsyncIterator[bytes]:
+    yield chunk
+
+
+async def merge_by_revision(
+    cursors: list[AsyncIterator[dict]],
+) -> AsyncIterator[tuple[int, dict]]:
+    """Yield (cursor index, doc) across revision-sorted cursors in global revision order."""
+    heap = []
+    for index, cursor in enumerate(cursors):
+        doc = await anext(cursor, None)
+        if doc is not None:
+            heap.append((doc["revision"], index, doc))
+    heapq.heapify(heap)
+
+    while heap:
+        _, index, doc = heapq.heappop(heap)
+        yield index, doc
+        doc = await anext(cursors[index], None)
+        if doc is not None:
+            heapq.heappush(heap, (doc["revision"], index, doc))
+
+
+class PushReplayCache:
+    """Responses to /sync/push requests that carried an Idempotency-Key.
+
+    The first request with a key claims it in Redis, runs, and stores its
+    response. A retry gets the stored response without touching Mongo or
+    allocating revisions; one that arrives while the first is still running
+    waits for it. Keys are per account.
+    """
+
+    def __init__(self, cache: RedisCache):
+        self.cache = cache
+
+    async def run(
+        self,
+        owner: str,
+        key: str,
+        fingerprint: str,
+        push: Callable[[], Awaitable[PushResponse]],
+    ) -> tuple[PushResponse, bool]:
+        """Return the response for ``key`` and whether it was replayed.
+
+        ``fingerprint`` identifies the request body; reusing a key for a
+        different body is refused.
+        """
+        if self.cache.client is None:
+            return await push(), False
+        redis_key = IDEMPOTENCY_KEY.format(owner=owner, key=key)
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+        delay = 0.05
+        while True:
+            # The token makes the claim ours alone: releasing or overwriting
+            # it never touches a claim another request has taken since.
+            claim = dumps({"fingerprint": fingerprint, "token": uuid.uuid4().hex}).decode()
+            if await self.cache.set_if_absent(redis_key, claim, IDEMPOTENCY_PENDING_TTL):
+                refresher = asyncio.create_task(self._keep_claim(redis_key, claim))
+                try:
+                    result = await push()
+                except BaseException:
+                    # Let a retry run the push again.
+                    refresher.cancel()
+                    await self.cache.delete_if_equals(redis_key, claim)
+                    raise
+                refresher.cancel()
+                stored = dumps({"fingerprint": fingerprint, "response": result.dict()}).decode()
+                await self.cache.replace_if_equals(redis_key, claim, stored, IDEMPOTENCY_KEY_TTL)
+                return result, False
+
+            stored = await self.cache.get_json(redis_key)
+            if stored is not None:
+                if stored["fingerprint"] != fingerprint:
+                    raise http_error(
+                        code="IDEMPOTENCY_KEY_REUSED",
+                        message="Idempotency-Key was already used for a different request.",
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                if "response" in stored:
+                    return PushResponse(**stored["response"]), True
+
+            # The original is still running (or just failed and released the
+            # key, in which case the next round claims it).
+            if time.monotonic() >= deadline:
+                raise http_error(
+                    code="IDEMPOTENCY_KEY_IN_PROGRESS",
+                    message="A request with this Idempotency-Key is still in progress.",
+                    status_code=status.HTTP_409_CONFLICT,
+                )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def _keep_claim(self, redis_key: str, claim: str) -> None:
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_CLAIM_REFRESH)
+            await self.cache.expire_if_equals(redis_key, claim, IDEMPOTENCY_PENDING_TTL)
+
+
 class SyncService:
-    def __init__(self, store: MongoStore):
+    def __init__(
+        self,
+        store: MongoStore,
+        attachments: AttachmentService,
+        revision_feed: RevisionFeed,
+        journal_lists: JournalListCache,
+    ):
         self.store = store
+        self.attachments = attachments
+        self.revision_feed = revision_feed
+        self.journal_lists = journal_lists
 
-    async def get_changes(self, since: int = 0) -> SyncChangesResponse:
-        entry_docs = await self.store.get_entries_since(since)
-        attachment_docs = await self.store.get_attachments_meta_since(since)
-        journal_docs = await self.store.get_journals_since(since)
-
-        entry_changes = [
-            EntryChange(
-                id=doc["id"],
-                journalId=doc["journal_id"],
-                payloadEncrypted=doc["payload_encrypted"],
-                payloadVersion=doc["payload_version"],
-                attachmentIds=doc["attachment_ids"],
-                createdAt=doc["created_at"],
-                updatedAt=doc["updated_at"],
-                deletedAt=doc.get("deleted_at"),
-                revision=doc.get("revision"),
-            )
-            for doc in entry_docs
-        ]
-        attachment_changes = [
-            AttachmentMeta(
-                id=doc["id"],
-                sha256=doc["sha256"],
-                sizeBytes=doc["size_bytes"],
-                mimeType=doc["mime_type"],
-                createdAt=doc["created_at"],
-                updatedAt=doc["updated_at"],
-                deletedAt=doc.get("deleted_at"),
-                revision=doc.get("revision"),
+    async def _caught_up(self, owner: str, since: int) -> Optional[int]:
+        """Return the published latest revision if ``since`` has already reached it.
+
+        When nothing is published yet (e.g. Redis was flushed) the current
+        sequence value is published so later polls can take the fast path.
+        """
+        latest = await self.revision_feed.latest(owner)
+        if latest is None:
+            await self.revision_feed.publish(
+                owner, await self.store.get_latest_revision(owner)
             )
-            for doc in attachment_docs
-        ]
-        journal_changes = [
-            JournalChange(
-                id=doc["id"],
-                name=doc["name"],
-                color=doc.get("color"),
-                createdAt=doc["created_at"],
-                updatedAt=doc["updated_at"],
-                deletedAt=doc.get("deleted_at"),
-                revision=doc.get("revision"),
+            return None
+        return latest if since >= latest else None
+
+    async def ensure_resumable(self, owner: str, since: int) -> None:
+        """Reject a cursor that predates compacted tombstones.
+
+        Deletions at or below the watermark may no longer be visible, so a
+        client that last synced before it must start over from since=0.
+        """
+        compacted_through = await self.store.get_compacted_through(owner)
+        if 0 < since < compacted_through:
+            raise http_error(
+                code="SYNC_RESYNC_REQUIRED",
+                message=(
+                    f"Changes through revision {compacted_through} have been compacted; "
+                    "discard synced data and sync again from since=0."
+                ),
+                status_code=status.HTTP_410_GONE,
+                headers={"X-Compacted-Through": str(compacted_through)},
             )
-            for doc in journal_docs
-        ]
 
-        entry_changes.sort(key=lambda e: e.revision or 0)
-        attachment_changes.sort(key=lambda a: a.revision or 0)
-        journal_changes.sort(key=lambda j: j.revision or 0)
+    async def get_changes(
+        self, owner: str, since: int = 0, limit: Optional[int] = None
+    ) -> dict:
+        """Return a page of changes shaped like SyncChangesResponse, as plain dicts.
 
-        latest_revision = await self.store.get_latest_revision()
+        Documents go straight from Mongo to the JSON encoder without building a
+        pydantic model per change.
+        """
+        latest = await self._caught_up(owner, since)
+        if latest is not None:
+            # Idle poll: nothing newer exists anywhere, so skip Mongo entirely.
+            return _idle_changes(latest, since)
 
-        return SyncChangesResponse(
-            latestRevision=latest_revision,
-            entries=entry_changes,
-            attachments=attachment_changes,
-            journals=journal_changes,
+        await self.ensure_resumable(owner, since)
+
+        limit = min(limit or SYNC_PAGE_SIZE, SYNC_MAX_PAGE_SIZE)
+        horizon = await self.store.get_read_horizon(owner)
+
+        # Each collection contributes at most limit + 1 documents; merging them
+        # by revision tells us where the page ends and whether anything is left.
+        entry_docs, attachment_docs, journal_docs = await asyncio.gather(
+            self.store.get_entries_since(owner, since, limit + 1, horizon),
+            self.store.get_attachments_meta_since(owner, since, limit + 1, horizon),
+            self.store.get_journals_since(owner, since, limit + 1, horizon),
         )
 
-    async def push_changes(self, payload: PushRequest) -> PushResponse:
-        accepted: list[str] = []
+        has_more = len(entry_docs) + len(attachment_docs) + len(journal_docs) > limit
+        if has_more:
+            revisions = heapq.merge(
+                *(
+                    (doc["revision"] for doc in docs)
+                    for docs in (entry_docs, attachment_docs, journal_docs)
+                )
+            )
+            cutoff = next(islice(revisions, limit - 1, None))
+            entry_docs = [doc for doc in entry_docs if doc["revision"] <= cutoff]
+            attachment_docs = [doc for doc in attachment_docs if doc["revision"] <= cutoff]
+            journal_docs = [doc for doc in journal_docs if doc["revision"] <= cutoff]
+
+        await self.store.upgrade_entry_payloads(owner, _binary_payloads(entry_docs))
+
+        entry_changes = [entry_change(doc) for doc in entry_docs]
+        attachment_changes = [attachment_change(doc) for doc in attachment_docs]
+        journal_changes = [journal_change(doc) for doc in journal_docs]
+
+        if has_more:
+            # Clients that predate paging move their cursor to latestRevision,
+            # so it must not run ahead of what this page delivered.
+            latest_revision = next_since = cutoff
+        else:
+            # Nothing at or below the horizon is left unread.
+            latest_revision = horizon
+            next_since = max(latest_revision, since)
+
+        return {
+            "latestRevision": latest_revision,
+            "entries": entry_changes,
+            "attachments": attachment_changes,
+            "journals": journal_changes,
+            "hasMore": has_more,
+            "nextSince": next_since,
+        }
+
+    async def get_changes_body(
+        self,
+        owner: str,
+        since: int = 0,
+        limit: Optional[int] = None,
+        media_type: str = "application/json",
+    ) -> bytes:
+        """``get_changes`` serialized as JSON or msgpack.
+
+        Identical polls that arrive while a page is being built share its
+        query and its body. The published latest revision is part of the key,
+        so a poll that starts after a newer revision was allocated builds its
+        own page instead of joining one that may predate it.
+        """
+        encode = packb if media_type == MSGPACK_MEDIA_TYPE else dumps
+        latest = await self.revision_feed.latest(owner)
+        if latest is not None and since >= latest:
+            return encode(_idle_changes(latest, since))
+
+        async def build() -> bytes:
+            return encode(await self.get_changes(owner, since, limit))
+
+        key = (owner, since, limit, media_type, latest)
+        return await changes_flights.do(key, build)
+
+    async def stream_changes(self, owner: str, since: int = 0) -> AsyncIterator[bytes]:
+        """Stream changes as NDJSON, one change per line, closed by an "end" line.
+
+        Checks that can fail run before the stream is returned, while an
+        error response can still be sent.
+        """
+        latest = await self._caught_up(owner, since)
+        if latest is not None:
+            return _single(dumps({"type": "end", "latestRevision": latest}) + b"\n")
+        await self.ensure_resumable(owner, since)
+        return self._stream_changes(owner, since)
+
+    async def _stream_changes(self, owner: str, since: int) -> AsyncIterator[bytes]:
+        # Documents are read straight off the revision-sorted cursors, so
+        # memory use does not grow with the size of the history being replayed.
+        horizon = await self.store.get_read_horizon(owner)
+
+        upgrades = []
+        cursors = change_cursors(self.store, owner, since, horizon)
+        async for index, doc in merge_by_revision(cursors):
+            kind, to_change = CHANGE_KINDS[index]
+            if index == 0:
+                upgrades += _binary_payloads([doc])
+                if len(upgrades) >= SYNC_PAGE_SIZE:
+                    await self.store.upgrade_entry_payloads(owner, upgrades)
+                    upgrades = []
+            yield dumps({"type": kind, "change": to_change(doc)}) + b"\n"
+        await self.store.upgrade_entry_payloads(owner, upgrades)
+
+        yield dumps({"type": "end", "latestRevision": horizon}) + b"\n"
+
+    async def push_changes(self, owner: str, payload: PushRequest) -> PushResponse:
+        """Write the pushed changes, each only if the client saw the stored revision.
+
+        The check is part of the write (see MongoStore._bulk_replace), so
+        concurrent pushes cannot both win. The only read up front is the
+        compaction watermark, and only for pushes that edit existing items.
+        """
         conflicts: list[str] = []
-        missing_attachments: set[str] = set()
-
-        for entry in payload.entries:
-            existing = await self.store.get_entry(entry.id)
-            if existing and entry.revision is not None and entry.revision < existing.get(
-                "revision", 0
-            ):
-                conflicts.append(entry.id)
-                continue
+        kinds = (
+            (
+                payload.entries,
+                _entry_doc,
+                self.store.bulk_upsert_entries,
+                self.store.get_entry_revisions,
+            ),
+            (
+                payload.attachmentsMeta,
+                _attachment_meta_doc,
+                self.store.bulk_upsert_attachments_meta,
+                self.store.get_attachment_meta_revisions,
+            ),
+            (
+                payload.journals,
+                _journal_doc,
+                self.store.bulk_upsert_journals,
+                self.store.get_journal_revisions,
+            ),
+        )
+        pending = [_dedupe(items, conflicts) for items, *_ in kinds]
+        if any(item.revision is not None for items in pending for item in items):
+            compacted_through = await self.store.get_compacted_through(owner)
+            for index, (*_, get_revisions) in enumerate(kinds):
+                pending[index] = await self._drop_compacted(
+                    owner, pending[index], compacted_through, get_revisions, conflicts
+                )
+        written: list[list] = [[] for _ in kinds]
 
-            current_revision = await self.store.get_next_revision()
-            mongo_entry = MongoEntry(
-                id=entry.id,
-                journal_id=entry.journalId,
-                payload_encrypted=entry.payloadEncrypted,
-                payload_version=entry.payloadVersion,
-                attachment_ids=entry.attachmentIds,
-                created_at=entry.createdAt,
-                updated_at=entry.updatedAt,
-                deleted_at=entry.deletedAt,
-                revision=current_revision,
-            )
-            await self.store.upsert_entry(mongo_entry)
-            accepted.append(entry.id)
-
-            for att_id in entry.attachmentIds:
-                content = await self.store.get_attachment_content(att_id)
-                if not content:
-                    missing_attachments.add(att_id)
-
-        for meta in payload.attachmentsMeta:
-            existing_meta = await self.store.get_attachment_meta(meta.id)
-            if existing_meta and meta.revision is not None and meta.revision < existing_meta.get(
-                "revision", 0
-            ):
-                conflicts.append(meta.id)
-                continue
+        reserved: list[int] = []
+        try:
+            for _ in range(PUSH_WRITE_ATTEMPTS):
+                count = sum(len(items) for items in pending)
+                if not count:
+                    break
+                block = await self.store.reserve_revisions(owner, count)
+                reserved += block
+                revisions = iter(block)
+                for index, (_, to_doc, upsert, get_revisions) in enumerate(kinds):
+                    items = pending[index]
+                    if not items:
+                        continue
+                    docs = [to_doc(owner, item, next(revisions)) for item in items]
+                    failed = await upsert(docs, {item.id: item.revision for item in items})
+                    written[index] += [doc for doc in docs if doc.id not in failed]
+                    pending[index] = await self._sort_failed(
+                        owner, items, failed, get_revisions, conflicts
+                    )
+        finally:
+            visible = await self.store.settle_revisions(owner, reserved)
+        conflicts += [item.id for items in pending for item in items]
 
-            current_revision = await self.store.get_next_revision()
-            mongo_meta = MongoAttachmentMeta(
-                id=meta.id,
-                sha256=meta.sha256,
-                size_bytes=meta.sizeBytes,
-                mime_type=meta.mimeType,
-                created_at=meta.createdAt,
-                updated_at=meta.updatedAt,
-                deleted_at=meta.deletedAt,
-                revision=current_revision,
-            )
-            await self.store.upsert_attachment_meta(mongo_meta)
-            accepted.append(meta.id)
-
-        for journal in payload.journals:
-            existing_journal = await self.store.get_journal(journal.id)
-            if (existing_journal and journal.revision is not None
-                    and journal.revision < existing_journal.get("revision", 0)):
-                conflicts.append(journal.id)
-                continue
+        mongo_entries, mongo_metas, mongo_journals = written
+        accepted = [doc.id for docs in written for doc in docs]
+
+        referenced = {att_id for entry in mongo_entries for att_id in entry.attachment_ids}
+        existing = await self.store.get_existing_attachment_ids(owner, list(referenced))
+        missing_attachments = await self._link_known_blobs(
+            owner, referenced - existing, payload.attachmentsMeta
+        )
 
-            current_revision = await self.store.get_next_revision()
-            mongo_journal = MongoJournal(
-                id=journal.id,
-                name=journal.name,
-                color=journal.color,
-                created_at=journal.createdAt,
-                updated_at=journal.updatedAt,
-                deleted_at=journal.deletedAt,
-                revision=current_revision,
+        if mongo_journals:
+            await self.journal_lists.invalidate(owner)
+        if visible is not None:
+            # Settling may also have uncovered other pushes' revisions that
+            # were waiting behind ours.
+            await self.revision_feed.announce(owner, visible)
+        elif accepted:
+            latest = max(doc.revision for docs in written for doc in docs)
+            await self.revision_feed.announce(
+                owner, latest, delay=self.store.readable_in(owner, latest)
             )
-            await self.store.upsert_journal(mongo_journal)
-            accepted.append(journal.id)
 
         return PushResponse(
             accepted=accepted,
             conflicts=conflicts,
             missingAttachments=sorted(missing_attachments),
         )
+
+    async def _drop_compacted(
+        self,
+        owner: str,
+        items: list,
+        compacted_through: int,
+        get_revisions,
+        conflicts: list[str],
+    ) -> list:
+        """Record as conflicts edits of items whose tombstone was compacted away.
+
+        A client that saw an item at or below the compaction watermark, which
+        the server no longer has, is editing something deleted since; the
+        upsert would otherwise bring it back.
+        """
+        old = [
+            item.id
+            for item in items
+            if item.revision is not None and item.revision <= compacted_through
+        ]
+        if not old:
+            return items
+        stored = await get_revisions(owner, old)
+        gone = {item_id for item_id in old if item_id not in stored}
+        conflicts += [item.id for item in items if item.id in gone]
+        return [item for item in items if item.id not in gone]
+
+    async def _sort_failed(
+        self, owner: str, items: list, failed: set[str], get_revisions, conflicts: list[str]
+    ) -> list:
+        """Record real conflicts among items whose write failed; return the rest to retry.
+
+        A write also fails when the stored revision is not below the new one.
+        That happens when another worker issues higher revisions than ours:
+        an HLC node whose clock runs ahead, or a lease taken after ours.
+        Reading the stored revisions moves our clock, or our lease, past
+        them.
+        """
+        if not failed:
+            return []
+        stored = await get_revisions(owner, list(failed))
+        retry = []
+        for item in items:
+            if item.id not in failed:
+                continue
+            if item.revision is not None and item.revision < stored.get(item.id, 0):
+                conflicts.append(item.id)
+            else:
+                retry.append(item)
+        return retry
+
+    async def _link_known_blobs(
+        self, owner: str, attachment_ids: set[str], metas: list[AttachmentMeta]
+    ) -> set[str]:
+        """Link attachments whose content the account already stores under the
+        same sha256 and return the ones that still need an upload."""
+        if not attachment_ids:
+            return attachment_ids
+
+        hashes = {meta.id: meta.sha256.lower() for meta in metas if meta.id in attachment_ids}
+        unknown = [att_id for att_id in attachment_ids if att_id not in hashes]
+        stored_hashes = await self.store.get_attachment_meta_hashes(owner, unknown)
+        hashes.update({att_id: sha256.lower() for att_id, sha256 in stored_hashes.items()})
+
+        # Knowing a digest is no proof of holding the content, so only blobs
+        # this account already references are reused without an upload.
+        stored = await self.store.get_owned_blob_hashes(owner, list(set(hashes.values())))
+        missing = set()
+        for att_id in attachment_ids:
+            sha256 = hashes.get(att_id)
+            if sha256 not in stored or not await self.attachments.link(owner, att_id, sha256):
+                missing.add(att_id)
+        return missing
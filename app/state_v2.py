@@ -1,24 +1,74 @@
+import asyncio
+
+from app.database.blobs import BlobStore, make_blob_store
 from app.database.mongo import MongoStore
 from app.database.redis import RedisCache
+from app.services.revision_feed import RevisionFeed
+from app.services.snapshot import SNAPSHOT_INTERVAL, SnapshotService
 from typing import Optional
 
 _mongo_store: Optional[MongoStore] = None
 _redis_cache: Optional[RedisCache] = None
+_blob_store: Optional[BlobStore] = None
+_revision_feed: Optional[RevisionFeed] = None
+_revision_listener: Optional[asyncio.Task] = None
+_snapshot_service: Optional[SnapshotService] = None
+_snapshot_refresher: Optional[asyncio.Task] = None
 
 
-async def init_databases(mongodb_url: str, db_name: str, redis_url: str):
-    global _mongo_store, _redis_cache
+async def init_databases(
+    mongodb_url: str,
+    db_name: str,
+    redis_url: str,
+    revision_lease_size: int = 0,
+    revision_lease_ttl: float = 2.0,
+    revision_block_ttl: float = 30.0,
+    revision_source: str = "sequence",
+    hlc_node_id: Optional[int] = None,
+    hlc_read_delay: float = 1.0,
+    attachment_storage: str = "mongo",
+    attachment_storage_path: str = "/data/attachments",
+):
+    global _mongo_store, _redis_cache, _blob_store, _revision_feed, _revision_listener
+    global _snapshot_service, _snapshot_refresher
 
-    _mongo_store = MongoStore(mongodb_url, db_name)
+    _mongo_store = MongoStore(
+        mongodb_url,
+        db_name,
+        revision_lease_size=revision_lease_size,
+        revision_lease_ttl=revision_lease_ttl,
+        revision_block_ttl=revision_block_ttl,
+        revision_source=revision_source,
+        hlc_node_id=hlc_node_id,
+        hlc_read_delay=hlc_read_delay,
+    )
+    _blob_store = make_blob_store(attachment_storage, attachment_storage_path, _mongo_store.db)
     await _mongo_store.init_indexes()
 
     _redis_cache = RedisCache(redis_url)
     await _redis_cache.connect()
 
+    _revision_feed = RevisionFeed(_redis_cache)
+    _snapshot_service = SnapshotService(_mongo_store, _blob_store, _redis_cache)
+    _mongo_store.revision_listeners.append(_revisions_reserved)
+    _revision_listener = asyncio.create_task(_revision_feed.listen())
+
+    if SNAPSHOT_INTERVAL > 0:
+        _snapshot_refresher = asyncio.create_task(_snapshot_service.run())
+
+
+async def _revisions_reserved(owner: str, revisions: list[int]) -> None:
+    await _revision_feed.publish(owner, revisions[-1])
+    await _snapshot_service.note_changes(owner, len(revisions))
+
 
 async def close_databases():
     global _mongo_store, _redis_cache
 
+    if _revision_listener:
+        _revision_listener.cancel()
+    if _snapshot_refresher:
+        _snapshot_refresher.cancel()
     if _mongo_store:
         await _mongo_store.close()
     if _redis_cache:
@@ -35,3 +85,21 @@ async def get_redis_cache() -> RedisCache:
     if _redis_cache is None:
         raise RuntimeError("Redis cache not initialized. Call init_databases first.")
     return _redis_cache
+
+
+async def get_blob_store() -> BlobStore:
+    if _blob_store is None:
+        raise RuntimeError("Blob store not initialized. Call init_databases first.")
+    return _blob_store
+
+
+async def get_revision_feed() -> RevisionFeed:
+    if _revision_feed is None:
+        raise RuntimeError("Revision feed not initialized. Call init_databases first.")
+    return _revision_feed
+
+
+async def get_snapshot_service() -> SnapshotService:
+    if _snapshot_service is None:
+        raise RuntimeError("Snapshot service not initialized. Call init_databases first.")
+    return _snapshot_service
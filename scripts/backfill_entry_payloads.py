@@ -0,0 +1,66 @@
+import os
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from app.core.sync_encoding import payload_to_storage
+
+BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "1000"))
+# Seconds to sleep between batches, to keep the backfill from crowding out
+# foreground traffic.
+BATCH_PAUSE = float(os.getenv("BACKFILL_BATCH_PAUSE", "0.1"))
+
+
+async def backfill():
+    mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    db_name = os.getenv("MONGODB_DB_NAME", "journal_db")
+
+    client = AsyncIOMotorClient(mongodb_url)
+    db = client[db_name]
+
+    print(f"Connected to MongoDB at {mongodb_url}, database: {db_name}")
+
+    converted = skipped = 0
+    last_id = None
+    while True:
+        query = {"payload_encrypted": {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = (
+            await db.entries.find(query, {"payload_encrypted": 1})
+            .sort("_id", 1)
+            .limit(BATCH_SIZE)
+            .to_list(length=BATCH_SIZE)
+        )
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        updates = []
+        for doc in docs:
+            payload = payload_to_storage(doc["payload_encrypted"])
+            if isinstance(payload, bytes):
+                # Matching on the old text skips entries rewritten meanwhile.
+                updates.append(
+                    UpdateOne(
+                        {"_id": doc["_id"], "payload_encrypted": doc["payload_encrypted"]},
+                        {"$set": {"payload_encrypted": payload}},
+                    )
+                )
+            else:
+                skipped += 1
+
+        if updates:
+            result = await db.entries.bulk_write(updates, ordered=False)
+            converted += result.modified_count
+        print(f"Converted {converted} entries so far ({skipped} not base64, left as text)")
+
+        await asyncio.sleep(BATCH_PAUSE)
+
+    client.close()
+    print(f"Backfill completed: {converted} converted, {skipped} left as text")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
@@ -0,0 +1,86 @@
+import os
+import asyncio
+import time
+import uuid
+from datetime import datetime
+
+from pymongo import monitoring
+
+from app.database.blobs import GridFSBlobStore
+from app.database.mongo import MongoStore
+from app.database.redis import RedisCache
+from app.schemas.sync import EntryChange, PushRequest
+from app.services.attachments_v2 import AttachmentService
+from app.services.journal_v2 import JournalListCache
+from app.services.revision_feed import RevisionFeed
+from app.services.sync_v2 import SyncService
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def bench():
+    mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    db_name = os.getenv("MONGODB_DB_NAME", "journal_bench")
+
+    counter = CommandCounter()
+    monitoring.register(counter)
+
+    store = MongoStore(mongodb_url, db_name)
+    await store.init_indexes()
+    # Without a connection the Redis-backed helpers are no-ops, which keeps
+    # the count to Mongo round trips.
+    redis_cache = RedisCache(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    service = SyncService(
+        store,
+        AttachmentService(store, GridFSBlobStore(store.db)),
+        RevisionFeed(redis_cache),
+        JournalListCache(redis_cache),
+    )
+
+    print(f"Connected to MongoDB at {mongodb_url}, database: {db_name}")
+
+    for size in (1, 10, 100, 500):
+        now = datetime.utcnow()
+        payload = PushRequest(
+            entries=[
+                EntryChange(
+                    id=str(uuid.uuid4()),
+                    journalId="00000000-0000-0000-0000-000000000001",
+                    payloadEncrypted="AAAA",
+                    payloadVersion=1,
+                    attachmentIds=[],
+                    createdAt=now,
+                    updatedAt=now,
+                )
+                for _ in range(size)
+            ]
+        )
+
+        counter.count = 0
+        started = time.perf_counter()
+        await service.push_changes("bench@example.com", payload)
+        elapsed = time.perf_counter() - started
+
+        print(
+            f"{size:>4} entries: {counter.count:>4} round trips, "
+            f"{elapsed * 1000:.1f} ms"
+        )
+
+    await store.client.drop_database(db_name)
+    await store.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
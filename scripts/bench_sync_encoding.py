@@ -0,0 +1,87 @@
+import gzip
+import os
+import time
+import uuid
+from datetime import datetime
+
+from app.core.sync_encoding import dumps, entry_change, packb, unpackb
+from app.schemas.sync import PushRequest
+
+ENTRY_COUNT = 500
+ROUNDS = 20
+
+
+def make_docs(payload_size: int) -> list[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "journal_id": "00000000-0000-0000-0000-000000000001",
+            "payload_encrypted": os.urandom(payload_size),
+            "payload_version": 1,
+            "attachment_ids": [],
+            "created_at": now,
+            "updated_at": now,
+            "deleted_at": None,
+            "revision": revision,
+        }
+        for revision in range(1, ENTRY_COUNT + 1)
+    ]
+
+
+def changes_for(docs: list[dict]) -> dict:
+    return {
+        "latestRevision": len(docs),
+        "entries": [entry_change(doc) for doc in docs],
+        "attachments": [],
+        "journals": [],
+        "hasMore": False,
+        "nextSince": len(docs),
+    }
+
+
+def cpu_per_entry(fn) -> float:
+    """Server CPU time per entry, in microseconds."""
+    started = time.process_time()
+    for _ in range(ROUNDS):
+        fn()
+    return (time.process_time() - started) / ROUNDS / ENTRY_COUNT * 1e6
+
+
+def bench():
+    print(f"{ENTRY_COUNT} entries per batch, {ROUNDS} rounds")
+    print(
+        f"{'payload':>8} {'format':>8} {'bytes/entry':>12} {'gzip/entry':>11} "
+        f"{'changes us':>11} {'push us':>8}"
+    )
+
+    for payload_size in (64, 1024, 16 * 1024):
+        docs = make_docs(payload_size)
+        push_json = dumps({"entries": changes_for(docs)["entries"]})
+        push_msgpack = packb({"entries": changes_for(docs)["entries"]})
+
+        results = {
+            "json": (
+                dumps(changes_for(docs)),
+                lambda: dumps(changes_for(docs)),
+                lambda: PushRequest.model_validate_json(push_json),
+            ),
+            "msgpack": (
+                packb(changes_for(docs)),
+                lambda: packb(changes_for(docs)),
+                lambda: PushRequest.model_validate(unpackb(push_msgpack)),
+            ),
+        }
+
+        for name, (body, encode, decode) in results.items():
+            print(
+                f"{payload_size:>8} {name:>8} "
+                f"{len(body) / ENTRY_COUNT:>12.1f} "
+                f"{len(gzip.compress(body)) / ENTRY_COUNT:>11.1f} "
+                f"{cpu_per_entry(encode):>11.2f} "
+                f"{cpu_per_entry(decode):>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    bench()
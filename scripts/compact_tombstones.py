@@ -0,0 +1,30 @@
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+from app.database.mongo import MongoStore
+
+# Devices that have not synced for longer than this must do a full resync.
+TOMBSTONE_RETENTION_DAYS = float(os.getenv("TOMBSTONE_RETENTION_DAYS", "90"))
+BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", "1000"))
+
+
+async def compact():
+    mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    db_name = os.getenv("MONGODB_DB_NAME", "journal_db")
+
+    store = MongoStore(mongodb_url, db_name)
+
+    print(f"Connected to MongoDB at {mongodb_url}, database: {db_name}")
+
+    deleted_before = datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    print(f"Removing tombstones written before {deleted_before.isoformat()}")
+
+    removed, owners = await store.compact_tombstones(deleted_before, BATCH_SIZE)
+
+    await store.close()
+    print(f"Compaction completed: {removed} removed across {owners} accounts")
+
+
+if __name__ == "__main__":
+    asyncio.run(compact())
@@ -0,0 +1,57 @@
+import os
+import sys
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.database.blobs import make_blob_store
+
+# Run before switching ATTACHMENT_STORAGE: attachment_blobs and snapshots name
+# blobs by sha256 only, so the new backend must already hold every one of them.
+SOURCE_STORAGE = os.getenv("SOURCE_ATTACHMENT_STORAGE")
+SOURCE_PATH = os.getenv("SOURCE_ATTACHMENT_STORAGE_PATH", "/data/attachments")
+TARGET_STORAGE = os.getenv("ATTACHMENT_STORAGE", "mongo")
+TARGET_PATH = os.getenv("ATTACHMENT_STORAGE_PATH", "/data/attachments")
+
+
+async def copy():
+    if not SOURCE_STORAGE:
+        sys.exit("Set SOURCE_ATTACHMENT_STORAGE to the backend being migrated from")
+
+    mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    db_name = os.getenv("MONGODB_DB_NAME", "journal_db")
+
+    client = AsyncIOMotorClient(mongodb_url)
+    db = client[db_name]
+    source = make_blob_store(SOURCE_STORAGE, SOURCE_PATH, db)
+    target = make_blob_store(TARGET_STORAGE, TARGET_PATH, db)
+
+    print(f"Connected to MongoDB at {mongodb_url}, database: {db_name}")
+    print(f"Copying blobs from {SOURCE_STORAGE} to {TARGET_STORAGE}")
+
+    hashes = [doc["sha256"] async for doc in db.attachment_blobs.find({}, {"sha256": 1})]
+    async for snapshot in db.snapshots.find({}, {"sha256": 1, "previous_sha256": 1}):
+        hashes.extend(h for h in (snapshot.get("sha256"), snapshot.get("previous_sha256")) if h)
+
+    copied = present = missing = 0
+    for sha256 in dict.fromkeys(hashes):
+        if await target.open(sha256) is not None:
+            present += 1
+            continue
+        body = await source.open(sha256)
+        if body is None:
+            print(f"  missing in source: {sha256}")
+            missing += 1
+            continue
+        written, _ = await target.write(body.iter_chunks())
+        if written != sha256:
+            sys.exit(f"Blob {sha256} read back as {written}; aborting")
+        copied += 1
+
+    client.close()
+    print(f"Copy completed: {copied} copied, {present} already present, {missing} missing")
+    if missing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(copy())
@@ -0,0 +1,96 @@
+import os
+import sys
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+
+# Account (login email) that owns everything written before accounts were
+# partitioned.
+LEGACY_OWNER = os.getenv("LEGACY_OWNER")
+
+
+async def migrate():
+    if not LEGACY_OWNER:
+        sys.exit("Set LEGACY_OWNER to the email of the account that owns existing data")
+
+    mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    db_name = os.getenv("MONGODB_DB_NAME", "journal_db")
+
+    client = AsyncIOMotorClient(mongodb_url)
+    db = client[db_name]
+
+    print(f"Connected to MongoDB at {mongodb_url}, database: {db_name}")
+
+    # 1. Assign existing documents to the legacy owner
+    for name in ("journals", "entries", "attachments_meta", "attachments_content", "attachment_refs"):
+        result = await db[name].update_many(
+            {"owner": {"$exists": False}}, {"$set": {"owner": LEGACY_OWNER}}
+        )
+        print(f"{name}: assigned {result.modified_count} documents to {LEGACY_OWNER}")
+
+    # GridFS files named by attachment id (stored before content addressing);
+    # content-addressed blobs are named by sha256 and shared between accounts.
+    result = await db["attachments.files"].update_many(
+        {
+            "filename": {"$not": {"$regex": "^([0-9a-f]{64}$|pending:)"}},
+            "metadata.owner": {"$exists": False},
+        },
+        {"$set": {"metadata.owner": LEGACY_OWNER}},
+    )
+    print(f"attachments.files: assigned {result.modified_count} legacy files to {LEGACY_OWNER}")
+
+    # 2. Carry the global sequence over to the owner's own counter. Its
+    # revisions keep counting from where they were, so clients resume with
+    # the `since` they already hold.
+    legacy = await db.sequences.find_one({"name": "_id"})
+    if legacy:
+        await db.sequences.update_one(
+            {"name": f"revision:{LEGACY_OWNER}"},
+            {
+                "$max": {
+                    "value": legacy.get("value", 0),
+                    "compacted_through": legacy.get("compacted_through", 0),
+                }
+            },
+            upsert=True,
+        )
+        print(f"Sequence carried over at revision {legacy.get('value', 0)}")
+
+    # 3. Replace the global indexes with per-owner ones
+    for name in ("journals", "entries", "attachments_meta"):
+        for index in ("id_1", "revision_1"):
+            try:
+                await db[name].drop_index(index)
+                print(f"{name}: dropped index {index}")
+            except OperationFailure:
+                pass
+        await db[name].create_index([("owner", 1), ("id", 1)], unique=True)
+        await db[name].create_index([("owner", 1), ("revision", 1)])
+    try:
+        await db.attachments_meta.drop_index("id_1")
+    except OperationFailure:
+        pass
+    for name in ("attachments_content", "attachment_refs"):
+        try:
+            await db[name].drop_index("id_1")
+            print(f"{name}: dropped index id_1")
+        except OperationFailure:
+            pass
+        await db[name].create_index([("owner", 1), ("id", 1)], unique=True)
+    await db["attachments.files"].create_index([("filename", 1), ("metadata.owner", 1)])
+    print("Indexes created")
+
+    # 4. The global bootstrap snapshot holds only legacy data, so it becomes
+    # the legacy owner's
+    snapshot = await db.snapshots.find_one_and_delete({"_id": "current"})
+    if snapshot:
+        snapshot["_id"] = LEGACY_OWNER
+        await db.snapshots.replace_one({"_id": LEGACY_OWNER}, snapshot, upsert=True)
+        print(f"Snapshot at revision {snapshot['revision']} moved to {LEGACY_OWNER}")
+
+    client.close()
+    print("Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,50 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api.routes.attachments_v2 import _parse_range
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=10-", (10, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=990-5000", (990, 999)),
+        ("bytes=999-999", (999, 999)),
+        ("Bytes = 5-6", (5, 6)),
+    ],
+)
+def test_single_ranges(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        "items=0-1",
+        "bytes=0-1,5-6",
+        "bytes=5",
+        "bytes=a-b",
+        "bytes=-0",
+        "bytes=-",
+        "bytes=6-5",
+    ],
+)
+def test_ranges_served_in_full(header):
+    assert _parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-2000"])
+def test_ranges_past_the_end_are_unsatisfiable(header):
+    with pytest.raises(HTTPException) as exc_info:
+        _parse_range(header, 1000)
+
+    assert exc_info.value.status_code == 416
+    assert exc_info.value.headers["Content-Range"] == "bytes */1000"
+
+
+def test_empty_attachment_has_no_satisfiable_range():
+    with pytest.raises(HTTPException):
+        _parse_range("bytes=0-", 0)
@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import pytest
+
+from app.models.mongo import MongoEntry
+
+pytestmark = pytest.mark.anyio
+
+OWNER = "a@example.com"
+
+
+def entry(entry_id: str, revision, journal_id: str = "j", owner: str = OWNER) -> MongoEntry:
+    now = datetime(2024, 1, 1)
+    return MongoEntry(
+        owner=owner,
+        id=entry_id,
+        journal_id=journal_id,
+        payload_encrypted=b"payload",
+        payload_version=1,
+        attachment_ids=[],
+        created_at=now,
+        updated_at=now,
+        revision=revision,
+    )
+
+
+@pytest.fixture
+async def store(make_store):
+    # HLC revisions are never re-stamped, so documents keep the revision
+    # they were written with.
+    return await make_store(revision_source="hlc", hlc_node_id=1)
+
+
+async def stored(store, entry_id: str, owner: str = OWNER) -> dict:
+    return await store.db.entries.find_one({"owner": owner, "id": entry_id})
+
+
+async def test_inserts_new_documents(store):
+    failed = await store.bulk_upsert_entries([entry("e1", 1), entry("e1", 2, owner="b@example.com")])
+
+    assert failed == set()
+    assert (await stored(store, "e1"))["revision"] == 1
+    assert (await stored(store, "e1", "b@example.com"))["revision"] == 2
+
+
+async def test_stale_expected_revision_is_rejected(store):
+    await store.bulk_upsert_entries([entry("e1", 5, journal_id="old")])
+
+    failed = await store.bulk_upsert_entries([entry("e1", 7, journal_id="new")], {"e1": 3})
+
+    assert failed == {"e1"}
+    doc = await stored(store, "e1")
+    assert (doc["revision"], doc["journal_id"]) == (5, "old")
+
+
+async def test_equal_expected_revision_is_written(store):
+    await store.bulk_upsert_entries([entry("e1", 5)])
+
+    failed = await store.bulk_upsert_entries([entry("e1", 7, journal_id="new")], {"e1": 5})
+
+    assert failed == set()
+    doc = await stored(store, "e1")
+    assert (doc["revision"], doc["journal_id"]) == (7, "new")
+
+
+@pytest.mark.parametrize("expected", [None, {"e1": None}])
+async def test_no_expected_revision_replaces_older(store, expected):
+    await store.bulk_upsert_entries([entry("e1", 5)])
+
+    assert await store.bulk_upsert_entries([entry("e1", 7)], expected) == set()
+    assert (await stored(store, "e1"))["revision"] == 7
+
+
+async def test_newer_stored_revision_wins(store):
+    await store.bulk_upsert_entries([entry("e1", 9, journal_id="newer")])
+
+    failed = await store.bulk_upsert_entries([entry("e1", 7)], {"e1": None})
+
+    assert failed == {"e1"}
+    assert (await stored(store, "e1"))["journal_id"] == "newer"
+
+
+async def test_stored_document_without_revision_is_replaced(store):
+    await store.db.entries.insert_one(entry("e1", None).dict())
+
+    assert await store.bulk_upsert_entries([entry("e1", 3)], {"e1": 0}) == set()
+    assert (await stored(store, "e1"))["revision"] == 3
+
+
+async def test_duplicate_ids_keep_the_last_document(store):
+    models = [entry("e1", 3, journal_id="first"), entry("e1", 4, journal_id="last")]
+
+    assert await store.bulk_upsert_entries(models) == set()
+
+    assert await store.db.entries.count_documents({"owner": OWNER, "id": "e1"}) == 1
+    doc = await stored(store, "e1")
+    assert (doc["revision"], doc["journal_id"]) == (4, "last")
+
+
+async def test_only_conflicting_documents_fail(store):
+    await store.bulk_upsert_entries([entry("e1", 5), entry("e2", 5)])
+
+    failed = await store.bulk_upsert_entries(
+        [entry("e1", 8), entry("e2", 8), entry("e3", 8)], {"e1": 5, "e2": 4}
+    )
+
+    assert failed == {"e2"}
+    revisions = await store.get_entry_revisions(OWNER, ["e1", "e2", "e3"])
+    assert revisions == {"e1": 8, "e2": 5, "e3": 8}
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.mongo import MongoEntry, MongoJournal
+from app.services.revision_feed import RevisionFeed
+from app.services.sync_v2 import SyncService
+
+pytestmark = pytest.mark.anyio
+
+OWNER = "a@example.com"
+NOW = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+async def store(make_store):
+    store = await make_store()
+    # Entries at revisions 1, 2, 4 and 5 and a journal at 3, written directly
+    # so no revision block is left open.
+    for revision in (1, 2, 4, 5):
+        doc = MongoEntry(
+            owner=OWNER,
+            id=f"e{revision}",
+            journal_id="j",
+            payload_encrypted=b"payload",
+            payload_version=1,
+            attachment_ids=[],
+            created_at=NOW,
+            updated_at=NOW,
+            revision=revision,
+        )
+        await store.db.entries.insert_one(doc.dict())
+    journal = MongoJournal(owner=OWNER, id="j", name="j", created_at=NOW, updated_at=NOW, revision=3)
+    await store.db.journals.insert_one(journal.dict())
+    await store.db.sequences.insert_one({"name": f"revision:{OWNER}", "value": 5})
+    return store
+
+
+@pytest.fixture
+def service(store, cache):
+    return SyncService(store, None, RevisionFeed(cache), None)
+
+
+def revisions(page: dict) -> list[int]:
+    changes = page["entries"] + page["attachments"] + page["journals"]
+    return sorted(change["revision"] for change in changes)
+
+
+async def test_pages_end_at_the_cutoff(service):
+    page = await service.get_changes(OWNER, since=0, limit=2)
+
+    assert revisions(page) == [1, 2]
+    assert page["hasMore"] is True
+    # latestRevision must not run ahead of what the page delivered.
+    assert page["latestRevision"] == page["nextSince"] == 2
+
+
+async def test_cutoff_spans_collections(service):
+    page = await service.get_changes(OWNER, since=2, limit=2)
+
+    assert revisions(page) == [3, 4]
+    assert [journal["id"] for journal in page["journals"]] == ["j"]
+    assert page["hasMore"] is True
+    assert page["latestRevision"] == page["nextSince"] == 4
+
+
+async def test_last_page_reports_the_horizon(service):
+    page = await service.get_changes(OWNER, since=4, limit=2)
+
+    assert revisions(page) == [5]
+    assert page["hasMore"] is False
+    assert page["latestRevision"] == page["nextSince"] == 5
+
+
+async def test_paging_delivers_every_change_once(service):
+    seen, since, more = [], 0, True
+    while more:
+        page = await service.get_changes(OWNER, since=since, limit=1)
+        seen += revisions(page)
+        since, more = page["nextSince"], page["hasMore"]
+
+    assert seen == [1, 2, 3, 4, 5]
+
+
+async def test_reads_stop_below_open_blocks(store, service):
+    await store.db.sequences.update_one(
+        {"name": f"revision:{OWNER}"},
+        {"$set": {"leases": [{"start": 4, "expires_at": datetime.utcnow() + timedelta(minutes=1)}]}},
+    )
+
+    page = await service.get_changes(OWNER, since=0, limit=10)
+
+    assert revisions(page) == [1, 2, 3]
+    assert page["hasMore"] is False
+    assert page["latestRevision"] == 3
@@ -0,0 +1,76 @@
+import gzip
+import zlib
+
+import pytest
+
+from app.core.compression import _gunzip, choose_encoding
+
+BOTH = ["zstd", "gzip"]
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        (None, None),
+        ("", None),
+        ("gzip", "gzip"),
+        ("gzip, zstd", "zstd"),
+        ("GZIP;q=0.5, zstd;q=0.4", "gzip"),
+        ("zstd;q=0, gzip", "gzip"),
+        ("zstd;q=0, gzip;q=0", None),
+        ("*", "zstd"),
+        ("*;q=0.1, gzip;q=0.5", "gzip"),
+        ("*, zstd;q=0", "gzip"),
+        ("zstd;q=oops, gzip;q=0.2", "gzip"),
+        ("br, identity", None),
+    ],
+)
+def test_choose_encoding(accept_encoding, expected):
+    assert choose_encoding(accept_encoding, BOTH) == expected
+
+
+def test_choose_encoding_only_offers_what_is_available():
+    assert choose_encoding("zstd", ["gzip"]) is None
+
+
+def test_gunzip_single_member():
+    assert _gunzip(gzip.compress(b"hello"), 100) == (b"hello", False)
+
+
+def test_gunzip_concatenated_members():
+    data = gzip.compress(b"hello ") + gzip.compress(b"world")
+
+    assert _gunzip(data, 100) == (b"hello world", False)
+
+
+def test_gunzip_empty_body():
+    assert _gunzip(b"", 100) == (b"", False)
+
+
+def test_gunzip_limit_is_inclusive():
+    assert _gunzip(gzip.compress(b"x" * 100), 100) == (b"x" * 100, False)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        gzip.compress(b"x" * 101),
+        gzip.compress(b"x" * 60) + gzip.compress(b"x" * 60),
+        gzip.compress(b"\0" * 10_000_000),
+    ],
+)
+def test_gunzip_rejects_oversized_bodies(data):
+    assert _gunzip(data, 100) == (b"", True)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        gzip.compress(b"hello world")[:-4],
+        gzip.compress(b"hello") + gzip.compress(b"world")[:10],
+        b"not gzip",
+    ],
+)
+def test_gunzip_rejects_truncated_or_invalid_bodies(data):
+    with pytest.raises(zlib.error):
+        _gunzip(data, 100)
@@ -0,0 +1,85 @@
+import pytest
+
+from app.core.hlc import LOGICAL_BITS, MAX_COUNTER, NODE_BITS, HybridLogicalClock
+
+
+class FakeWall:
+    def __init__(self, ms: int):
+        self.ms = ms
+
+    def __call__(self) -> int:
+        return self.ms
+
+
+def parts(revision: int) -> tuple[int, int, int]:
+    """(milliseconds, counter, node ID) of ``revision``."""
+    return (
+        revision >> LOGICAL_BITS,
+        (revision >> NODE_BITS) & MAX_COUNTER,
+        revision & ((1 << NODE_BITS) - 1),
+    )
+
+
+def test_reserve_counts_within_a_millisecond():
+    clock = HybridLogicalClock(7, FakeWall(1000))
+
+    assert [parts(revision) for revision in clock.reserve(3)] == [
+        (1000, 0, 7),
+        (1000, 1, 7),
+        (1000, 2, 7),
+    ]
+
+
+def test_reserve_resets_the_counter_when_the_wall_clock_moves():
+    wall = FakeWall(1000)
+    clock = HybridLogicalClock(7, wall)
+    clock.reserve(2)
+
+    wall.ms = 1005
+
+    assert parts(clock.reserve(1)[0]) == (1005, 0, 7)
+
+
+def test_reserve_borrows_the_next_millisecond_when_the_counter_runs_out():
+    clock = HybridLogicalClock(7, FakeWall(1000))
+
+    revisions = clock.reserve(MAX_COUNTER + 3)
+
+    assert revisions == sorted(set(revisions))
+    assert [parts(revision) for revision in revisions[-2:]] == [(1001, 0, 7), (1001, 1, 7)]
+
+
+def test_reserve_never_goes_back_with_the_wall_clock():
+    wall = FakeWall(1000)
+    clock = HybridLogicalClock(7, wall)
+    before = clock.reserve(1)[0]
+
+    wall.ms = 900
+
+    assert clock.reserve(1)[0] > before
+
+
+def test_observe_moves_past_revisions_from_other_nodes():
+    clock = HybridLogicalClock(7, FakeWall(1000))
+    other = HybridLogicalClock(3, FakeWall(5000)).reserve(5)[-1]
+
+    clock.observe(other)
+
+    revision = clock.reserve(1)[0]
+    assert revision > other
+    assert parts(revision) == (5000, 5, 7)
+
+
+def test_observe_ignores_older_revisions():
+    clock = HybridLogicalClock(7, FakeWall(1000))
+    clock.reserve(1)
+
+    clock.observe(HybridLogicalClock(3, FakeWall(500)).reserve(1)[0])
+
+    assert parts(clock.reserve(1)[0]) == (1000, 1, 7)
+
+
+@pytest.mark.parametrize("node_id", [-1, 1 << NODE_BITS])
+def test_node_id_must_fit(node_id):
+    with pytest.raises(ValueError):
+        HybridLogicalClock(node_id)